@@ -1,4 +0,0 @@
-#!/usr/bin/bash
-
-picom &
-/usr/bin/emacs --daemon &
@@ -0,0 +1,49 @@
+"""
+Per-poll cost and import time of the CPU widget backends.
+
+    cd ~/.config/qtile && python -m bench.cpu [-n POLLS]
+"""
+import argparse
+import subprocess
+import sys
+import timeit
+
+from custom.sampler import ProcCPU, PsutilCPU
+
+
+def import_time(backend, runs=5):
+    """
+    Best time of the first `backend` in a fresh interpreter, in ms: what it
+    imports (psutil in PsutilCPU.__init__) and sets up. custom.sampler,
+    which the two share, is imported before the clock starts.
+    """
+    code = ('import custom.sampler, time; t = time.perf_counter(); '
+            'custom.sampler.{}(); print(time.perf_counter() - t)').format(backend)
+    return min(float(subprocess.check_output([sys.executable, '-c', code]))
+               for _ in range(runs)) * 1000
+
+
+def poll_time(reader, number):
+    """ Mean cost of one read, in µs """
+    snapshot = {}
+    reader.read(snapshot)  # warm up, the first read has no previous sample
+    return timeit.timeit(lambda: reader.read(snapshot), number=number) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--polls', type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = [
+        ('psutil', import_time('PsutilCPU'), poll_time(PsutilCPU(), args.polls)),
+        ('proc', import_time('ProcCPU'), poll_time(ProcCPU(), args.polls)),
+    ]
+
+    print('{:<8} {:>12} {:>12}'.format('backend', 'import ms', 'poll µs'))
+    for name, imported, poll in rows:
+        print('{:<8} {:>12.2f} {:>12.1f}'.format(name, imported, poll))
+
+
+if __name__ == '__main__':
+    main()
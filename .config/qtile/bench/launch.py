@@ -0,0 +1,96 @@
+"""
+The launchers of the config against interleaved windows: a plain emacs
+frame pressed for while the vterm pool is being refilled, in every order
+the windows can map in, and whether each ends up where it belongs.
+
+    cd ~/.config/qtile && python -m bench.launch
+
+Nothing is spawned: the windows are fakes with the class and title the
+real frames have, handed to the hooks as qtile would (client_new, then
+client_managed).
+"""
+import importlib
+from itertools import count
+
+wids = count(1)
+
+
+class FakeWindow:
+    def __init__(self, wm_class, name):
+        self.wid = next(wids)
+        self.wm_class = wm_class
+        self.name = name
+        self.group = None
+
+    def get_wm_class(self):
+        return self.wm_class
+
+    def togroup(self, group):
+        self.group = group
+
+
+class FakeQtile:
+    def __init__(self):
+        self.windows_map = {}
+        self.current_group = type('Group', (), {'name': '1'})
+        self.spawned = []
+
+    def cmd_spawn(self, command):
+        self.spawned.append(command)
+
+    def call_later(self, delay, callback, *args):
+        pass
+
+
+# (what happens, in order): 'press' is M1+2, 'vterm' and 'emacs' the
+# frames mapping, of the pool refill and of the press
+ORDERS = [
+    ('press', 'vterm', 'emacs'),
+    ('press', 'emacs', 'vterm'),
+    ('vterm', 'press', 'emacs'),
+]
+
+
+def run(order):
+    """ Whether the press got the plain frame and the pool the vterm one """
+    launchers = importlib.import_module('config').launchers
+    emacs, vterm = launchers.launchers['emacs'], launchers.launchers['vterm']
+    for launcher in launchers.launchers.values():
+        launcher.pending.clear()
+        launcher.warm = None
+        launcher.timings = type(launcher.timings)()
+        launcher.warm_timings = type(launcher.warm_timings)()
+
+    qtile = FakeQtile()
+    # the pool is being refilled
+    vterm.ready = None
+    vterm.refill(qtile)
+    frames = {
+        'vterm': FakeWindow(['emacs', 'Emacs'], 'vterm'),
+        'emacs': FakeWindow(['emacs', 'Emacs'], '*scratch* - Doom Emacs'),
+    }
+    for event in order:
+        if event == 'press':
+            emacs.launch(qtile)
+            continue
+        window = frames[event]
+        qtile.windows_map[window.wid] = window
+        launchers.new(window)
+        launchers.managed(window)
+
+    # M1+5 is then served from the pool
+    vterm.launch(qtile)
+    return (vterm.warm_timings.count == 1
+            and frames['vterm'].group == qtile.current_group.name
+            and frames['emacs'].group is None
+            and emacs.timings.count == 1)
+
+
+def main():
+    print('{:<24} {:>6}'.format('order', 'ok'))
+    for order in ORDERS:
+        print('{:<24} {:>6}'.format(', '.join(order), 'yes' if run(order) else 'NO'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+Cost of the custom layouts, headless: fake clients count the place, hide
+and unhide calls that would be X requests, for 1 to 1000 windows.
+
+    cd ~/.config/qtile && python -m bench.layouts [-n REPEATS] [-w WINDOWS ...] [--no-time]
+
+One row per layout, operation and window count, in a fixed order, so two
+runs can be diffed (--no-time leaves only the request counts, which do
+not vary between runs). Every call is counted, an unhide of a window that
+is already mapped too: Window.unhide sends its MapWindow regardless.
+"""
+import argparse
+from time import perf_counter
+
+import libqtile
+from libqtile.config import ScreenRect
+
+from custom.layouts import Max, MaxFocus, Monad, MonadFocus
+
+
+# the screen with the bar shown and hidden
+SHOWN = ScreenRect(0, 27, 1920, 1053)
+HIDDEN = ScreenRect(0, 0, 1920, 1080)
+
+
+class FakeClient:
+    """ Counts the calls that would be X requests on a real window """
+
+    def __init__(self, group, wid):
+        self.group = group
+        self.wid = wid
+        self.name = 'w{}'.format(wid)
+        self.floating = False
+        # like a new X window, not mapped until a layout shows it
+        self.hidden = True
+
+    @property
+    def has_focus(self):
+        return self.group.current_window is self
+
+    def place(self, x, y, width, height, borderwidth, bordercolor,
+              above=False, margin=None, respect_hints=False):
+        self.group.requests += 1
+        # the geometry Window.place ends up with, the resize commands read it
+        if margin is not None:
+            if isinstance(margin, int):
+                margin = [margin] * 4
+            x += margin[3]
+            y += margin[0]
+            width -= margin[1] + margin[3]
+            height -= margin[0] + margin[2]
+        self.x, self.y, self.width, self.height = x, y, width, height
+
+    def hide(self):
+        self.group.requests += 1
+        self.hidden = True
+
+    def unhide(self):
+        self.group.requests += 1
+        self.hidden = False
+
+
+class FakeGroup:
+    """ The parts of libqtile.group._Group a layout calls back into """
+
+    name = 'bench'
+    screen = None
+
+    def __init__(self, layout, windows, screen_rect=SHOWN):
+        self.layout = layout.clone(self)
+        self.screen_rect = screen_rect
+        self.requests = 0
+        self.windows = []
+        self.current_window = None
+        self.created = 0
+        # one pass for all of them, the setup would be quadratic otherwise
+        for _ in range(windows):
+            self.layout.add(self._new_window())
+        self.focus(self.windows[-1])
+
+    def _new_window(self):
+        window = FakeClient(self, self.created)
+        self.created += 1
+        self.windows.append(window)
+        return window
+
+    def add_window(self):
+        window = self._new_window()
+        self.layout.add(window)
+        self.focus(window)
+        return window
+
+    def remove_window(self, window):
+        # what Group.remove does for a tiled window: a pass either way
+        self.windows.remove(window)
+        had_focus = window is self.current_window
+        next_focus = self.layout.remove(window) or (
+            None if had_focus else self.current_window) or self.layout.focus_first()
+        if had_focus:
+            self.current_window = None
+            if next_focus is not None:
+                self.focus(next_focus)
+                return
+        self.layout_all()
+
+    def layout_all(self, warp=False):
+        normal = [w for w in self.windows if not w.floating]
+        if normal:
+            self.layout.layout(normal, self.screen_rect)
+
+    def focus(self, win, warp=True, force=False):
+        # what Group.focus does: tell the layout, then lay everything out
+        self.current_window = win
+        self.layout.focus(win)
+        self.layout_all(warp)
+
+
+class FakeQtile:
+    """ The event loop of the relayouts the layout commands coalesce """
+
+    def __init__(self):
+        self.pending = []
+
+    def call_soon(self, func, *args):
+        self.pending.append((func, args))
+
+    def run_pending(self):
+        while self.pending:
+            func, args = self.pending.pop(0)
+            func(*args)
+
+
+# the operations, each a function(group) returning what undoes it
+# (untimed), if anything, and the layout method it needs
+def configure(group):
+    # every window placed again, as when the bar is toggled
+    group.screen_rect = HIDDEN if group.screen_rect is SHOWN else SHOWN
+    group.layout_all()
+
+
+def add(group):
+    window = group.add_window()
+    return lambda: group.remove_window(window)
+
+
+def remove(group):
+    # a window without focus, the focused one when it is alone
+    focused = group.current_window
+    window = next((w for w in group.windows if w is not focused), focused)
+    group.remove_window(window)
+
+    def undo():
+        group.add_window()
+        if focused is not window:
+            group.focus(focused)
+    return undo
+
+
+def next_(group):
+    group.layout.next()
+
+
+def previous(group):
+    group.layout.previous()
+
+
+def normalize(group):
+    group.layout.cmd_normalize()
+
+
+def golden(group):
+    group.layout.cmd_golden()
+    return group.layout.cmd_normalize
+
+
+def grow(group):
+    group.layout.cmd_grow()
+    return group.layout.cmd_shrink
+
+
+def shrink(group):
+    group.layout.cmd_shrink()
+    return group.layout.cmd_grow
+
+
+OPERATIONS = [
+    ('configure', configure, 'configure'),
+    ('add', add, 'add'),
+    ('remove', remove, 'remove'),
+    ('next', next_, 'next'),
+    ('previous', previous, 'previous'),
+    ('normalize', normalize, 'cmd_normalize'),
+    ('golden', golden, 'cmd_golden'),
+    ('grow', grow, 'cmd_grow'),
+    ('shrink', shrink, 'cmd_shrink'),
+]
+
+LAYOUTS = [
+    ('Max', Max(border_width=2, border_focus='#44475a', margin=5)),
+    ('MaxStack', Max(border_width=2, border_focus='#44475a', margin=5, stacking=True)),
+    ('MaxFocus', MaxFocus(border_width=2, border_focus='#44475a', margin=5)),
+    ('Monad', Monad(border_width=3, margin=5, align=1, change_ratio=0.02,
+                    min_secondary_size=85)),
+    ('MonadFocus', MonadFocus(border_width=3, margin=5, align=1, change_ratio=0.02,
+                              min_secondary_size=85)),
+]
+
+
+def measure(layout, operation, windows, repeats):
+    """ X requests and µs of one `operation` """
+    qtile = libqtile.qtile
+    group = FakeGroup(layout, windows)
+    # resize a secondary pane where there is one
+    group.focus(group.windows[min(1, windows - 1)])
+    qtile.run_pending()
+
+    requests = 0
+    seconds = 0.0
+    for _ in range(repeats):
+        group.requests = 0
+        start = perf_counter()
+        undo = operation(group)
+        qtile.run_pending()
+        seconds += perf_counter() - start
+        requests += group.requests
+
+        if undo is not None:
+            undo()
+            qtile.run_pending()
+    return requests / repeats, seconds / repeats * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--repeats', type=int, default=10)
+    parser.add_argument('-w', '--windows', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--no-time', action='store_true',
+                        help="only the request counts, to diff between commits")
+    args = parser.parse_args()
+
+    # relayout() schedules on the event loop of libqtile.qtile
+    libqtile.qtile = FakeQtile()
+
+    header = '{:<10} {:<10} {:>8} {:>10}'.format('layout', 'operation', 'windows', 'requests')
+    if not args.no_time:
+        header += ' {:>10}'.format('µs')
+    print(header)
+
+    for label, layout in LAYOUTS:
+        for name, operation, method in OPERATIONS:
+            if not hasattr(layout, method):
+                continue
+            for windows in args.windows:
+                requests, us = measure(layout, operation, windows, args.repeats)
+                row = '{:<10} {:<10} {:>8} {:>10.1f}'.format(
+                    label, name, windows, requests)
+                if not args.no_time:
+                    row += ' {:>10.1f}'.format(us)
+                print(row, flush=True)
+
+
+if __name__ == '__main__':
+    main()
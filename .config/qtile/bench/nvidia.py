@@ -0,0 +1,149 @@
+"""
+NvidiaSensors against a fake nvidia-smi: the text shown for streamed
+lines, for malformed ones, and when the query process exits and is
+respawned or ignores SIGTERM, and how long stopping it blocks the loop.
+
+    cd ~/.config/qtile && python -m bench.nvidia [-i INTERVAL_MS] [CASE ...]
+
+The fake is this file run with nvidia-smi's arguments: it prints the csv
+lines of two GPUs every --loop-ms, each line in two writes, the way
+`--query-gpu=... --format=csv,noheader --loop-ms=...` does.
+"""
+import argparse
+import asyncio
+import os
+import re
+import signal
+import sys
+import tempfile
+import time
+import types
+
+# what the fake prints for a field, on tick `tick` of GPU `gpu`
+VALUES = {
+    'temperature.gpu': lambda gpu, tick: str(40 + 10 * gpu + tick),
+    'fan.speed': lambda gpu, tick: '{} %'.format(30 + tick),
+    'pstate': lambda gpu, tick: 'P2',
+}
+CASES = ['stream', 'malformed', 'exit', 'stubborn']
+SHOWN = re.compile(r'(\d+)°C (\d+)%')
+
+
+def fake(argv):
+    """ nvidia-smi, as far as NvidiaSensors runs it; the case is in BENCH_NVIDIA """
+    options = dict(arg.lstrip('-').split('=', 1) for arg in argv if '=' in arg)
+    fields = options['query-gpu'].split(',')
+    interval = int(options['loop-ms']) / 1000
+    case = os.environ.get('BENCH_NVIDIA', 'stream')
+    if case == 'stubborn':
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    out = sys.stdout.buffer
+    tick = 0
+    while True:
+        if case == 'malformed' and tick == 1:
+            out.write(b'garbage\n[Unknown Error]\n0, 41\n')
+        for gpu in range(2):
+            line = ', '.join(VALUES[field](gpu, tick) if field != 'index' else str(gpu)
+                             for field in fields) + '\n'
+            half = len(line) // 2
+            out.write(line[:half].encode())
+            out.flush()
+            time.sleep(0.001)
+            out.write(line[half:].encode())
+            out.flush()
+        tick += 1
+        if case == 'exit' and tick == 2:
+            sys.exit(1)
+        time.sleep(interval)
+
+
+async def until(check, timeout=5.0):
+    start = time.monotonic()
+    while not check():
+        if time.monotonic() - start > timeout:
+            raise TimeoutError
+        await asyncio.sleep(0.005)
+
+
+async def run(case, interval, command):
+    """ (texts shown, query processes started, ms stop() took, reaped) """
+    from custom.widgets import NvidiaSensors
+
+    os.environ['BENCH_NVIDIA'] = case
+    loop = asyncio.get_running_loop()
+    widget = NvidiaSensors(format='{temp}°C {fan_speed}', nvidia_smi=command,
+                           update_interval=interval, respawn_delay=interval * 2)
+    widget.qtile = types.SimpleNamespace(call_later=loop.call_later, _eventloop=loop)
+    shown = []
+    widget.update = shown.append
+    # how many texts were shown when each query process started
+    spawns = []
+    spawn = widget.spawn
+
+    def counted():
+        spawn()
+        if widget.process is not None:
+            spawns.append(len(shown))
+    widget.spawn = counted
+
+    widget.timer_setup()
+    await until(lambda: len(spawns) == (2 if case == 'exit' else 1) and len(shown) - spawns[-1] >= 4)
+    process = widget.process
+    start = time.monotonic()
+    widget.stop()
+    stopped = (time.monotonic() - start) * 1000
+    await until(lambda: process.returncode is not None)
+    return shown, len(spawns), stopped, process.returncode is not None
+
+
+def check(shown, spawned):
+    """
+    Whether every text shows well-formed GPUs (GPU 1 is missing until its
+    first line), each from one line, going back to the first tick only
+    when the query process was respawned.
+    """
+    restarts = 0
+    last = None
+    for text in shown:
+        gpus = [SHOWN.fullmatch(part) for part in text.split(' - ')]
+        if not all(gpus) or len(gpus) > 2:
+            return False
+        # the fake prints temperature 40 + 10 * gpu + tick and fan 30 + tick
+        if any(int(m[1]) - int(m[2]) != 10 + 10 * gpu for gpu, m in enumerate(gpus)):
+            return False
+        tick = int(gpus[0][2]) - 30
+        if last is not None and tick < last:
+            restarts += 1
+        last = tick
+    return restarts == spawned - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-i', '--interval', type=float, default=50, help="--loop-ms of the fake")
+    parser.add_argument('cases', nargs='*', metavar='CASE',
+                        help="of {}, all of them if none".format(', '.join(CASES)))
+    args = parser.parse_args()
+
+    print('{:>10} {:>8} {:>8} {:>10} {:>8} {:>6}'.format(
+        'case', 'updates', 'spawned', 'stop ms', 'reaped', 'ok'))
+    with tempfile.TemporaryDirectory() as tmp:
+        command = os.path.join(tmp, 'nvidia-smi')
+        with open(command, 'w') as f:
+            f.write('#!/bin/sh\nexec {} {} "$@"\n'.format(sys.executable, os.path.abspath(__file__)))
+        os.chmod(command, 0o755)
+
+        for case in args.cases or CASES:
+            shown, spawned, stopped, reaped = asyncio.run(run(case, args.interval / 1000, command))
+            ok = check(shown, spawned) and reaped
+            print('{:>10} {:>8} {:>8} {:>10.2f} {:>8} {:>6}'.format(
+                case, len(shown), spawned, stopped, 'yes' if reaped else 'NO',
+                'yes' if ok else 'NO'), flush=True)
+
+
+if __name__ == '__main__':
+    if any(arg.startswith('--query-gpu=') for arg in sys.argv[1:]):
+        fake(sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,168 @@
+"""
+Held volume key against a fake sound server: how many requests the
+repeats cost, whether the widget ever shows a volume going backwards, and
+how long the server takes to reach the last target.
+
+    cd ~/.config/qtile && python -m bench.pulse [-n PRESSES] [-i INTERVAL_MS] [-l LATENCY_MS ...]
+
+The fake server speaks the part of the native protocol custom.pulse uses,
+on a socket of its own, and answers each request `latency` ms late, like
+a busy server would.
+"""
+import argparse
+import asyncio
+import os
+import struct
+import tempfile
+import time
+
+from custom.pulse import (AUTH, CVolume, ERROR, FACILITY_SINK, GET_SINK_INFO,
+                          INVALID_INDEX, REPLY, SET_CLIENT_NAME, SET_SINK_MUTE, SET_SINK_VOLUME,
+                          SUBSCRIBE, SUBSCRIBE_EVENT, VOLUME_NORM, frame, pack, unpack, Pulse)
+
+EVENT_CHANGE = 0x0010
+# pa_error_code_t
+ERR_NOENTITY = 5
+
+
+class FakeServer:
+    """ One stereo sink, 'fake', the default; counts the volume requests """
+
+    def __init__(self, latency=0.0, volume=20):
+        self.latency = latency
+        self.index = 1
+        self.values = [VOLUME_NORM * volume // 100] * 2
+        self.muted = False
+        self.sets = 0
+        self.server = None
+        self.clients = []
+
+    @property
+    def volume(self):
+        return round(max(self.values) * 100 / VOLUME_NORM)
+
+    async def start(self, path):
+        self.server = await asyncio.start_unix_server(self.serve, path)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def serve(self, reader, writer):
+        client = {'writer': writer, 'subscribed': False}
+        self.clients.append(client)
+        try:
+            while True:
+                length = struct.unpack('>5I', await reader.readexactly(20))[0]
+                command, tag, *args = unpack(await reader.readexactly(length))
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(frame(self.handle(client, command, tag, args)))
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            self.clients.remove(client)
+            writer.close()
+
+    def handle(self, client, command, tag, args):
+        if command == AUTH:
+            return pack(REPLY, tag, min(args[0], 32))
+        if command == SET_CLIENT_NAME:
+            return pack(REPLY, tag, len(self.clients))
+        if command == SUBSCRIBE:
+            client['subscribed'] = bool(args[0])
+            return pack(REPLY, tag)
+        if command == GET_SINK_INFO:
+            return pack(REPLY, tag) + self.sink_info()
+        if command in (SET_SINK_VOLUME, SET_SINK_MUTE):
+            if args[0] != self.index:
+                return pack(ERROR, tag, ERR_NOENTITY)
+            if command == SET_SINK_VOLUME:
+                self.values = list(args[2])
+                self.sets += 1
+            else:
+                self.muted = args[2]
+            self.changed()
+            return pack(REPLY, tag)
+        return pack(ERROR, tag, ERR_NOENTITY)
+
+    def changed(self):
+        event = frame(pack(SUBSCRIBE_EVENT, INVALID_INDEX, FACILITY_SINK | EVENT_CHANGE, self.index))
+        for client in self.clients:
+            if client['subscribed']:
+                client['writer'].write(event)
+
+    def sink_info(self):
+        """ The reply of a protocol 32 server, every field """
+        zero_usec = b'U' + bytes(8)
+        return b''.join([
+            pack(self.index, 'fake', 'Fake sink'),
+            b'a' + struct.pack('>BBI', 3, 2, 44100),
+            b'm' + bytes([2, 1, 2]),
+            pack(0, CVolume(self.values), self.muted, 0, 'fake.monitor'),
+            zero_usec,
+            pack('bench.pulse', 0, {'device.description': 'Fake sink'}),
+            zero_usec,
+            b'V' + struct.pack('>I', VOLUME_NORM),
+            pack(0, VOLUME_NORM + 1, INVALID_INDEX, 0, None),
+            # one format: encoding PCM, no properties
+            b'B\x01' + b'f' + b'B\x01' + pack({}),
+        ])
+
+
+async def until(check, timeout=5.0):
+    """ Seconds until `check()` holds """
+    start = time.monotonic()
+    while not check():
+        if time.monotonic() - start > timeout:
+            raise TimeoutError
+        await asyncio.sleep(0.001)
+    return time.monotonic() - start
+
+
+async def hold(presses, interval, latency, step=1):
+    """ `presses` repeats of a volume up key, `interval` seconds apart """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'native')
+        server = FakeServer(latency)
+        await server.start(path)
+        pulse = Pulse(server=path)
+        shown = []
+        pulse.subscribe(lambda volume, muted: shown.append(volume))
+        try:
+            await until(lambda: pulse.sink is not None)
+            start_volume = server.volume
+            expected = min(pulse.limit, start_volume + presses * step)
+            del shown[:]
+            for _ in range(presses):
+                pulse.change(step)
+                await asyncio.sleep(interval)
+            settle = await until(lambda: server.volume == expected and pulse.volume == expected)
+            backwards = sum(1 for a, b in zip(shown, shown[1:]) if b < a)
+            return server.sets, backwards, settle * 1000, pulse.volume == expected
+        finally:
+            pulse.close()
+            await until(lambda: not server.clients)
+            await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--presses', type=int, default=50)
+    parser.add_argument('-i', '--interval', type=float, default=30,
+                        help="ms between repeats, 30 for a 33Hz key repeat")
+    parser.add_argument('-l', '--latency', type=float, nargs='+', default=[0, 5, 50],
+                        help="ms the server takes to answer")
+    args = parser.parse_args()
+
+    print('{:>8} {:>8} {:>10} {:>10} {:>10} {:>6}'.format(
+        'latency', 'presses', 'requests', 'backwards', 'settle ms', 'ok'))
+    for latency in args.latency:
+        sets, backwards, settle, ok = asyncio.run(
+            hold(args.presses, args.interval / 1000, latency / 1000))
+        print('{:>8} {:>8} {:>10} {:>10} {:>10.1f} {:>6}'.format(
+            latency, args.presses, sets, backwards, settle, 'yes' if ok else 'NO'), flush=True)
+
+
+if __name__ == '__main__':
+    main()
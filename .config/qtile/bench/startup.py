@@ -0,0 +1,190 @@
+"""
+Startup cost of config.py: time per import and per widget/layout built,
+and, headless under Xvfb, the time to the first bar paint and of restarts.
+
+    cd ~/.config/qtile && python -m bench.startup [-n RUNS] [--xvfb] [--restarts N]
+
+Every number is the median of RUNS, so the output can be kept and compared
+from one commit (or qtile version) to the next.
+"""
+import argparse
+import importlib
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from os.path import abspath, dirname, join
+
+CONFIG_DIR = dirname(dirname(abspath(__file__)))
+CONFIG = join(CONFIG_DIR, 'config.py')
+
+# the imports worth reporting, the others are summed in their importer
+IMPORTS = re.compile(r'^(config|psutil|libqtile\.widget\.\w+|custom\.\w+)$')
+
+
+def import_times():
+    """ {module: (self ms, cumulative ms)} of `import config`, -X importtime """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import config'],
+                            cwd=CONFIG_DIR, stderr=subprocess.PIPE,
+                            stdout=subprocess.DEVNULL, text=True, check=True).stderr
+    times = {}
+    for line in stderr.splitlines():
+        # import time:  self [us] | cumulative | imported package
+        fields = line.split(':', 1)[-1].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        module = fields[2].strip()
+        if IMPORTS.match(module):
+            times[module] = (int(fields[0]) / 1000, int(fields[1]) / 1000)
+    return times
+
+
+def construction_times():
+    """
+    {object: ms} of building each widget and layout of config.py: the
+    Configurable.__init__ calls made from config.py itself (a widget
+    building another counts as one). The imports they trigger are left out.
+    """
+    from libqtile.configurable import Configurable
+
+    times = []
+    building = []
+
+    def profile(frame, event, arg):
+        if frame.f_code.co_name != '__init__':
+            return
+        if event == 'call' and not building and frame.f_back.f_code.co_filename == CONFIG:
+            obj = frame.f_locals.get('self')
+            if isinstance(obj, Configurable):
+                building.append((frame, obj, time.perf_counter()))
+        elif event == 'return' and building and building[0][0] is frame:
+            frame, obj, start = building.pop()
+            times.append((obj, (time.perf_counter() - start) * 1000))
+
+    sys.path.insert(0, CONFIG_DIR)
+    sys.modules.pop('config', None)
+    sys.setprofile(profile)
+    try:
+        importlib.import_module('config')
+    finally:
+        sys.setprofile(None)
+
+    # one row per object: Clock, or CPU#2 for the second CPU widget
+    seen = {}
+    rows = {}
+    for obj, ms in times:
+        name = type(obj).__name__
+        seen[name] = seen.get(name, 0) + 1
+        rows[name if seen[name] == 1 else '{}#{}'.format(name, seen[name])] = ms
+    return rows
+
+
+def run_qtile(restarts, timeout=30):
+    """
+    Start qtile on a new Xvfb display: the ms from the spawn to the first
+    bar paint, then the ms of each restart (from the restart to the next
+    first paint).
+    """
+    display = ':{}'.format(90 + os.getpid() % 100)
+    xvfb = subprocess.Popen(['Xvfb', display, '-screen', '0', '1920x1080x24', '-nolisten', 'tcp'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(0.5)
+        env = dict(os.environ, DISPLAY=display,
+                   BENCH_T0=repr(time.time()), BENCH_RESTARTS=str(restarts))
+        # --no-spawn: no startup_once, so no autostart
+        child = subprocess.run([sys.executable, abspath(__file__), '--child', '--no-spawn'],
+                               env=env, stdout=subprocess.PIPE, text=True, timeout=timeout)
+        paints = [json.loads(line) for line in child.stdout.splitlines()
+                  if line.startswith('{')]
+        return [paint['ms'] for paint in paints]
+    finally:
+        xvfb.terminate()
+        xvfb.wait()
+
+
+def child(qtile_args):
+    """
+    Run qtile with the first paint of the bar reported on stdout. It exits
+    after the first paint, or restarts while BENCH_RESTARTS says so: a
+    restart re-executes this script, qtile adding its --with-state.
+    """
+    sys.path.insert(0, CONFIG_DIR)
+    import libqtile
+    from libqtile.bar import Bar
+    from libqtile.scripts.main import main
+
+    actual_draw = Bar._actual_draw
+
+    def _actual_draw(bar):
+        actual_draw(bar)
+        if os.environ.get('BENCH_T0') is None:
+            return
+        ms = (time.time() - float(os.environ.pop('BENCH_T0'))) * 1000
+        print(json.dumps({'ms': ms}), flush=True)
+
+        restarts = int(os.environ['BENCH_RESTARTS'])
+        if restarts:
+            os.environ['BENCH_RESTARTS'] = str(restarts - 1)
+            os.environ['BENCH_T0'] = repr(time.time())
+            libqtile.qtile.call_soon(libqtile.qtile.restart)
+        else:
+            libqtile.qtile.call_soon(libqtile.qtile.stop)
+
+    Bar._actual_draw = _actual_draw
+
+    argv = sys.argv
+    sys.argv = ['qtile', 'start', '-c', CONFIG] + qtile_args
+    try:
+        main()
+    finally:
+        # what a restart re-executes
+        sys.argv = argv
+
+
+def median(values):
+    return statistics.median(values) if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=5)
+    parser.add_argument('--xvfb', action='store_true',
+                        help="also start qtile under Xvfb, for the first paint")
+    parser.add_argument('--restarts', type=int, default=3)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args, qtile_args = parser.parse_known_args()
+
+    if args.child:
+        child(qtile_args)
+        return
+
+    imports = [import_times() for _ in range(args.runs)]
+    print('{:<32} {:>10} {:>10}'.format('import', 'self ms', 'total ms'))
+    for module in sorted(imports[0], key=lambda m: -imports[0][m][1]):
+        runs = [run[module] for run in imports if module in run]
+        print('{:<32} {:>10.2f} {:>10.2f}'.format(
+            module, median([r[0] for r in runs]), median([r[1] for r in runs])))
+
+    # built in this process, once: the imports are cached after that
+    print()
+    print('{:<32} {:>10}'.format('built', 'ms'))
+    built = construction_times()
+    for name, ms in built.items():
+        print('{:<32} {:>10.2f}'.format(name, ms))
+    print('{:<32} {:>10.2f}'.format('(all)', sum(built.values())))
+
+    if args.xvfb:
+        runs = [run_qtile(args.restarts) for _ in range(args.runs)]
+        print()
+        print('{:<32} {:>10}'.format('qtile', 'ms'))
+        print('{:<32} {:>10.1f}'.format('first bar paint', median([r[0] for r in runs if r])))
+        restarts = [ms for r in runs for ms in r[1:]]
+        print('{:<32} {:>10.1f}'.format('restart to paint', median(restarts)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,43 @@
-from libqtile.config import Click, Drag, Group, Key, Match, Screen, KeyChord
-from libqtile import bar, layout, widget, qtile, hook
+from libqtile.config import Click, Drag, Group, Key, Screen, KeyChord
+from libqtile import bar, layout, widget, hook
 from libqtile.lazy import lazy
 
-from custom.layouts import Max, MaxFocus, MonadFocus
-from custom.widgets import CPU
+from custom.layouts import (Max, MaxFocus, Monad, MonadFocus,
+                            load_state, restore_state, save_state)
+from custom.widgets import (CPU, Clock, Memory, NvidiaSensors, PulseVolume, RunPrompt,
+                            Segment, ThermalSensor, show_bar)
+from custom.stats import instrument
+from custom.autostart import Program, path_exists, supervise
+from custom.launch import Launcher, Launchers
+from custom.pulse import pulse
+from custom.run import runner
 
-from os.path import expanduser
-import subprocess
+import os
 
 
 M4 = 'mod4'
 M1 = 'mod1'
 
+# --fg-daemon: stays the child we supervise, ready once the socket
+# emacsclient needs is up
+emacs_daemon = Program('emacs', ['/usr/bin/emacs', '--fg-daemon'],
+                       ready=path_exists('$XDG_RUNTIME_DIR/emacs/server',
+                                         '/tmp/emacs{}/server'.format(os.getuid())),
+                       restart=True)
+
+# key press to first window of the app bindings, see `launch_stats`
+# (with warm=True, of the presses the pool served);
+# the prewarmed ones wait hidden in the 'warm' group
+launchers = Launchers(
+    Launcher('kitty', "kitty --single-instance", 'kitty', prewarm=True),
+    Launcher('emacs', "emacsclient -c -a 'emacs'", 'emacs'),
+    Launcher('librewolf', 'librewolf', 'librewolf'),
+    Launcher('nautilus', 'nautilus', 'org.gnome.Nautilus'),
+    # named frames: the plain ones of 'emacs' have the same class
+    Launcher('vterm', "emacsclient -c -F '((name . \"vterm\"))' -a 'emacs' --eval '(+vterm/here nil)'",
+             'emacs', title='vterm', prewarm=True, ready=emacs_daemon.is_ready),
+)
+
 keys = [
     # Move window focus
     Key([M4], "h", lazy.layout.left()),
@@ -34,7 +60,9 @@ keys = [
     KeyChord([M4], 'y', [
         Key([], '1', lazy.layout.reset()),
         Key([], '2', lazy.layout.normalize()),
-        Key([], '3', lazy.layout.normalize_main())
+        Key([], '3', lazy.layout.normalize_main()),
+        Key([], '4', lazy.layout.golden()),
+        Key([], '5', lazy.layout.distribute(2, 1))
     ]),
 
     # Print ( date +  clipboard yank )
@@ -43,15 +71,10 @@ keys = [
 
     # Functions
     Key([M4], "q", lazy.window.kill()),
-    Key([M4], "e", lazy.hide_show_bar()),
+    Key([M4], "e", lazy.function(lambda manager: show_bar(manager.current_screen.top))),
 
-    # Extensions
-    Key([M4], 'r', lazy.run_extension(extension.DmenuRun(
-        dmenu_prompt='>_  ',
-        dmenu_lines=10,
-        dmenu_font='FiraCode',
-        dmenu_height=30,
-    ))),
+    # Run a program: Tab completes PATH, the most launched lately first
+    Key([M4], 'r', lazy.function(runner.prompt)),
 
     # Move to layout
     KeyChord([M4], 'w', [
@@ -62,16 +85,17 @@ keys = [
         ]),
 
     # Apps
-    Key([M1], '1', lazy.spawn("kitty --single-instance")),
-    Key([M1], '2', lazy.spawn("emacsclient -c -a 'emacs'")),
-    Key([M1], '3', lazy.spawn('librewolf')),
-    Key([M1], '4', lazy.spawn('nautilus')),
-    Key([M1], '5', lazy.spawn("emacsclient -c -a 'emacs' --eval '(+vterm/here nil)'")),
+    Key([M1], '1', launchers.spawn('kitty')),
+    Key([M1], '2', launchers.spawn('emacs')),
+    Key([M1], '3', launchers.spawn('librewolf')),
+    Key([M1], '4', launchers.spawn('nautilus')),
+    Key([M1], '5', launchers.spawn('vterm')),
 
     # Volume
-    Key([M1], 'q', lazy.spawn('amixer -q -D pulse set Master 10%-')),
-    Key([M1], 'w', lazy.spawn('amixer -q -D pulse set Master 10%+')),
-    Key([M1], 'e', lazy.spawn('amixer -q -D pulse set Master toggle')),
+    # one connection to the server, a held key sets the latest target
+    Key([M1], 'q', lazy.function(lambda manager: pulse.change(-10))),
+    Key([M1], 'w', lazy.function(lambda manager: pulse.change(10))),
+    Key([M1], 'e', lazy.function(lambda manager: pulse.toggle_mute())),
 
     # Scripts
     Key([M1], 'h', lazy.spawn('sudo ./scripts/clear_drop_caches.sh')),
@@ -111,6 +135,9 @@ for i in groups:
         Key([M4, "shift"], i.name, lazy.window.togroup(i.name, switch_group=False)),
     ])
 
+# no key and no label: never shown, not in the GroupBox
+groups.append(Group(launchers.pool, label=''))
+
 palette = {
     'main': ['#ff79c6',
              '#44475a',
@@ -153,7 +180,9 @@ monad_options = {
 max_options = {
     'margin': 5,
     'border_width': 2,
-    'border_focus': palette['main'][1]
+    'border_focus': palette['main'][1],
+    # switch windows by raising them, not by unmapping the others
+    'stacking': True
 }
 
 layouts = [
@@ -175,33 +204,18 @@ widget_defaults = dict(
 
 extension_defaults = widget_defaults.copy()
 
-textbox = {'fontsize': '20', 'padding': 0}
-
 top_bar = bar.Bar(
     size=22,
     opacity=1,
     margin=[5,5,0,5],
     widgets = [
-        widget.TextBox(
-            text=" ",
-            **textbox,
-            background=bar_palette['icon'][0]
-            ),
-        widget.Image(
-            filename=f'~/.config/qtile/images/ahaha.png',
-            background=bar_palette['icon'][0]
-            ),
-        widget.TextBox(
-            text="\uE0B0",
-            **textbox,
-            background=bar_palette['group'][0],
-            foreground=bar_palette['icon'][0]
-            ),
-        widget.TextBox(
-            text="\uE0B1",
-            **textbox,
-            background=bar_palette['group'][0],
-            foreground=bar_palette['icon'][0]
+        Segment(
+            head=" ",
+            icon='~/.config/qtile/images/ahaha.png',
+            tail="\uE0B0\uE0B1",
+            background=bar_palette['icon'][0],
+            tail_foreground=bar_palette['icon'][0],
+            tail_background=bar_palette['group'][0]
             ),
         widget.GroupBox(
             font='FiraCode Bold',
@@ -216,115 +230,91 @@ top_bar = bar.Bar(
             inactive=bar_palette['group'][1],
             active=bar_palette['group'][2],
             ),
-        widget.TextBox(
-            text="\uE0B0\uE0B1",
-            **textbox,
-            background=bar_palette['spacer'][0],
-            foreground=bar_palette['group'][0]
-            ),
-        widget.TextBox(
+        Segment(
+            head="\uE0B0\uE0B1",
             text="Kyah~",
             padding=10,
             foreground=bar_palette['group'][0],
             background=bar_palette['spacer'][0]
             ),
-        widget.Spacer(
+        RunPrompt(
+            font='FiraCode',
+            prompt='>_  ',
+            padding=10,
+            cursor_color=bar_palette['group'][0],
+            foreground=bar_palette['group'][0],
             background=bar_palette['spacer'][0]
             ),
-        widget.TextBox(
-            text="\uE0B3\uE0B2",
-            **textbox,
-            background=bar_palette['spacer'][0],
-            foreground=bar_palette['sys'][0]
-            ),
-        widget.TextBox(
-            text=" ",
-            background=bar_palette['sys'][0],
-            foreground=bar_palette['clock'][0]
-            ),
-        widget.Image(
-            margin=2,
-            filename=f'~/.config/qtile/images/cpu.png',
-            background=bar_palette['sys'][0]
+        widget.Spacer(
+            background=bar_palette['spacer'][0]
             ),
         CPU(
+            head="\uE0B3\uE0B2",
+            head_foreground=bar_palette['sys'][0],
+            head_background=bar_palette['spacer'][0],
+            icon='~/.config/qtile/images/cpu.png',
+            icon_margin=2,
             format=' ({freq_current}Ghz) {load_percent}%',
+            backend='proc',
+            graph='bars',
             background=bar_palette['sys'][0],
             foreground=bar_palette['sys'][1]
             ),
-        widget.Image(
-            margin=2,
-            filename=f'~/.config/qtile/images/thermometer.png',
-            background=bar_palette['sys'][0]
-            ),
-        widget.ThermalSensor(
+        ThermalSensor(
+            icon='~/.config/qtile/images/thermometer.png',
+            icon_margin=2,
             fmt='{}  ',
+            tail="\uE0B3 ",
+            tail_foreground=bar_palette['clock'][0],
             background=bar_palette['sys'][0],
             foreground=bar_palette['sys'][1]),
-        widget.TextBox(
-            text="\uE0B3 ",
-            **textbox,
-            background=bar_palette['sys'][0],
-            foreground=bar_palette['clock'][0]
-            ),
-        widget.Image(
-            filename=f'~/.config/qtile/images/ram.png',
-            background=bar_palette['sys'][0]
-            ),
-        widget.Memory(
+        Memory(
+            icon='~/.config/qtile/images/ram.png',
             format="{MemFree: .0f}M ",
             measure_mem="M",
+            tail="\uE0B3 ",
+            tail_foreground=bar_palette['clock'][0],
             background=bar_palette['sys'][0],
             foreground=bar_palette['sys'][1]
             ),
-        widget.TextBox(
-            text="\uE0B3 ",
-            **textbox,
-            background=bar_palette['sys'][0],
-            foreground=bar_palette['clock'][0]
-            ),
-        widget.Image(
-            margin=2,
-            filename=f'~/.config/qtile/images/graphics-card.png',
-            background=bar_palette['sys'][0]
-            ),
-        widget.NvidiaSensors(
+        NvidiaSensors(
+            icon='~/.config/qtile/images/graphics-card.png',
+            icon_margin=2,
             format="{temp}°C",
             padding=10,
+            tail="\uE0B3 ",
+            tail_foreground=bar_palette['clock'][0],
             background=bar_palette['sys'][0],
             foreground=bar_palette['sys'][1]
             ),
-        widget.TextBox(
-            text="\uE0B3 ",
-            **textbox,
-            background=bar_palette['sys'][0],
-            foreground=bar_palette['clock'][0]
-            ),
-        widget.Image(
-            margin=2,
-            filename='~/.config/qtile/images/loud-speaker.png',
-            background=bar_palette['sys'][0]
-            ),
-        widget.PulseVolume(
-            fmt='{}',
+        PulseVolume(
+            icon='~/.config/qtile/images/loud-speaker.png',
+            icon_margin=2,
             padding=10,
             background=bar_palette['sys'][0],
             foreground=bar_palette['sys'][1]
             ),
-        widget.TextBox(
-            text="\uE0B3\uE0B2",
-            **textbox,
-            background=bar_palette['sys'][0],
-            foreground=bar_palette['clock'][0]
+        Segment(
+            head="\uE0B3\uE0B2",
+            head_foreground=bar_palette['clock'][0],
+            background=bar_palette['sys'][0]
             ),
         widget.Systray(background=bar_palette['clock'][0]),
-        widget.Clock(
+        Clock(
             padding=10,
             format='%a %d %b %I:%M %p',
             background=bar_palette['clock'][0],
             foreground=bar_palette['clock'][1])
         ])
 
+# `qtile cmd-obj -o widget <name> -f stats` for poll (or read) and draw timings
+for w in top_bar.widgets:
+    if isinstance(w, NvidiaSensors):
+        # not polled: it reads nvidia-smi's lines as they come
+        instrument(w, slow_ms=50, methods=('_on_readable', 'draw'))
+    else:
+        instrument(w, slow_ms=50)
+
 main_screen = Screen(
     top_bar,
     wallpaper_mode='fill',
@@ -343,19 +333,39 @@ mouse = [
 
 @hook.subscribe.layout_change
 def hide_bar_focus_layout(layout, group):
-    """ Hide bar when in some focus layout """
+    """
+    Hide bar when in some focus layout. bar.show lays the windows out
+    with the new layout and the bar applied: after Group.use_layout, the
+    pass it runs next finds every geometry unchanged and places nothing,
+    and Screen.set_group, which fires this after its own pass, needs it.
+    """
     if group.screen: # avoid problems with screen start time
-        bar = group.screen.top.is_show()
-        if 'focus' in layout.name:
-            if bar is True:
-                group.screen.top.show(False)
-        else:
-            if bar is False:
-                group.screen.top.show(True)
+        show_bar(group.screen.top, 'focus' not in layout.name)
+
+# Monad ratios, pane sizes and window order survive lazy.restart()
+hook.subscribe.restart(save_state)
+hook.subscribe.startup(load_state)
+hook.subscribe.startup_complete(restore_state)
+
+autostart = [
+    Program('picom', ['picom'], restart=True),
+    emacs_daemon,
+]
+
+hook.subscribe.startup(launchers.expose)
+hook.subscribe.client_managed(launchers.managed)
+hook.subscribe.client_new(launchers.new)
+hook.subscribe.client_killed(launchers.killed)
+hook.subscribe.startup_complete(launchers.prewarm)
 
 @hook.subscribe.startup_once
 def start_once():
-    subprocess.call([expanduser('~/') + '.config/qtile/autostart.sh'])
+    supervise(autostart)
+
+@hook.subscribe.startup
+def adopt_autostart():
+    """ After lazy.restart(), supervise again what the previous qtile started """
+    supervise(autostart, adopt_only=True)
 
 dgroups_key_binder = None
 dgroups_app_rules = []  # type: List
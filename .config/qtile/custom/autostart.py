@@ -0,0 +1,206 @@
+import asyncio
+import os
+import time
+
+from libqtile.log_utils import logger
+
+
+PID_DIR = os.path.expanduser('~/.cache/qtile/autostart')
+
+
+def path_exists(*paths):
+    """ A readiness check: one of `paths` (a socket, a pid file) exists """
+    paths = [os.path.expanduser(os.path.expandvars(path)) for path in paths]
+    return lambda: any(os.path.exists(path) for path in paths)
+
+
+def _start_time(pid):
+    """ When `pid` started, in clock ticks since boot: a pid is reused, not this """
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            # after the command, which is in parentheses and may hold spaces
+            return int(f.read().rsplit(')', 1)[1].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def _wait_pid(pid):
+    """
+    The exit code of `pid`, a process not started by this qtile: a child
+    of the one before a restart (execv keeps the pid, so its children are
+    still ours to reap), or None when another session started it.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        fd = os.pidfd_open(pid)
+    except OSError:
+        return None
+    exited = loop.create_future()
+    loop.add_reader(fd, lambda: exited.done() or exited.set_result(None))
+    try:
+        await exited
+    finally:
+        loop.remove_reader(fd)
+        os.close(fd)
+    try:
+        _, status = os.waitpid(pid, 0)
+    except ChildProcessError:
+        return None
+    return os.waitstatus_to_exitcode(status)
+
+
+class Program:
+    """
+    An autostart entry: `args` is run, without a shell, when qtile starts,
+    and adopted again after a restart (from its pid file) instead of being
+    started twice.
+
+    `ready` is polled (every 0.1s, for up to `ready_timeout` seconds) until
+    the program can be used, not only started: the programs listed in
+    their `after` wait for it before starting, and `is_ready` tells the
+    rest of the config. With `restart` the program is started again when
+    it exits, after `restart_delay` seconds, doubling up to a minute while
+    it keeps exiting within `restart_delay` seconds of starting.
+    """
+
+    def __init__(self, name, args, ready=None, ready_timeout=30,
+                 restart=False, restart_delay=2, after=()):
+        self.name = name
+        self.args = args
+        self.ready = ready
+        self.ready_timeout = ready_timeout
+        self.restart = restart
+        self.restart_delay = restart_delay
+        self.after = after
+        self.pid = None
+        self._ready = None
+
+    @property
+    def pid_file(self):
+        return os.path.join(PID_DIR, self.name + '.pid')
+
+    def is_ready(self):
+        return self._ready is not None and self._ready.is_set()
+
+    async def run(self, pid=None):
+        """ Supervise the program, started here unless `pid` is adopted """
+        self._ready = asyncio.Event()
+        if pid is None:
+            for program in self.after:
+                await program.wait_ready()
+
+        delay = self.restart_delay
+        while True:
+            start = time.monotonic()
+            if pid is not None:
+                logger.info("autostart: %s still running (pid %s)", self.name, pid)
+                wait = _wait_pid(pid)
+            else:
+                try:
+                    process = await asyncio.create_subprocess_exec(
+                        *self.args,
+                        stdin=asyncio.subprocess.DEVNULL,
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.DEVNULL,
+                        # not killed with qtile: they outlive restarts
+                        start_new_session=True)
+                except OSError as e:
+                    logger.warning("autostart: unable to start %s: %s", self.name, e)
+                    self._ready.set()
+                    return
+                pid = process.pid
+                self._record(pid)
+                logger.info("autostart: %s started in %.0fms (pid %s)",
+                            self.name, (time.monotonic() - start) * 1000, pid)
+                wait = process.wait()
+
+            self.pid = pid
+            waiting = asyncio.ensure_future(wait)
+            await self._wait_ready(start, waiting)
+            code = await waiting
+            self.pid = pid = None
+            self._ready.clear()
+            self._forget()
+            if not self.restart:
+                logger.info("autostart: %s exited (%s)", self.name, code)
+                # gone for good: what waits for it should not wait forever
+                self._ready.set()
+                return
+
+            # crashing right away: wait longer before each new attempt
+            if time.monotonic() - start < self.restart_delay:
+                delay = min(delay * 2, 60)
+            else:
+                delay = self.restart_delay
+            logger.warning("autostart: %s exited (%s), restarting it in %ss",
+                           self.name, code, delay)
+            await asyncio.sleep(delay)
+
+    async def wait_ready(self):
+        """ Until this program is ready, or gave up on being so """
+        while self._ready is None:
+            await asyncio.sleep(0.1)
+        await self._ready.wait()
+
+    async def _wait_ready(self, start, exited):
+        if self.ready is not None:
+            while not self.ready():
+                if exited.done():
+                    return
+                if time.monotonic() - start > self.ready_timeout:
+                    logger.warning("autostart: %s not ready after %ss, starting what waits for it",
+                                   self.name, self.ready_timeout)
+                    break
+                await asyncio.sleep(0.1)
+            else:
+                logger.info("autostart: %s ready in %.0fms",
+                            self.name, (time.monotonic() - start) * 1000)
+        self._ready.set()
+
+    def running(self):
+        """ The pid of the instance a previous qtile started, if it still runs """
+        try:
+            with open(self.pid_file) as f:
+                pid, started = (int(field) for field in f.read().split())
+        except (OSError, ValueError):
+            return None
+        if _start_time(pid) != started:
+            self._forget()
+            return None
+        return pid
+
+    def _record(self, pid):
+        try:
+            os.makedirs(PID_DIR, exist_ok=True)
+            with open(self.pid_file, 'w') as f:
+                f.write('{} {}\n'.format(pid, _start_time(pid)))
+        except OSError:
+            logger.exception("autostart: unable to write %s", self.pid_file)
+
+    def _forget(self):
+        try:
+            os.remove(self.pid_file)
+        except OSError:
+            pass
+
+
+# the supervising tasks by program name, referenced so they are not
+# garbage collected, and so a second startup does not start them twice
+_tasks = {}
+
+
+def supervise(programs, adopt_only=False):
+    """
+    Start every program concurrently, without waiting for any, adopting
+    those still running from before a restart. With `adopt_only`, only
+    those are supervised: what the startup hook does, as startup_once
+    does not fire again after lazy.restart().
+    """
+    loop = asyncio.get_running_loop()
+    for program in programs:
+        task = _tasks.get(program.name)
+        if task is not None and not task.done():
+            continue
+        pid = program.running()
+        if pid is not None or not adopt_only:
+            _tasks[program.name] = loop.create_task(program.run(pid))
@@ -0,0 +1,83 @@
+import os
+import struct
+from glob import glob
+from hashlib import sha1
+
+import cairocffi
+
+from libqtile.images import Img
+from libqtile.log_utils import logger
+
+
+CACHE_DIR = os.path.expanduser('~/.cache/qtile/icons')
+
+# width, height and stride of the ARGB32 pixels that follow
+_HEADER = struct.Struct('<III')
+
+# (path, height) -> Icon, shared by every widget drawing that icon
+_atlas = {}
+
+
+class Icon:
+    """ A decoded, pre-scaled icon: paint `pattern` at the icon position """
+
+    def __init__(self, surface):
+        self.surface = surface
+        self.width = surface.get_width()
+        self.height = surface.get_height()
+        self.pattern = cairocffi.SurfacePattern(surface)
+
+
+def load(filename, height):
+    """
+    The PNG at `filename` scaled to `height`. It is decoded once per file
+    version and height: the scaled pixels are kept on disk, keyed by the
+    file mtime and the height, so restarts skip the PNG decoding.
+    """
+    path = os.path.expanduser(filename)
+    key = (path, height)
+    if key not in _atlas:
+        prefix = os.path.join(CACHE_DIR, sha1(path.encode()).hexdigest()[:16])
+        cache = '{}-{}-{}.argb'.format(prefix, os.stat(path).st_mtime_ns, height)
+        _atlas[key] = Icon(_from_cache(cache) or _render(path, height, cache, prefix))
+    return _atlas[key]
+
+
+def _from_cache(cache):
+    try:
+        with open(cache, 'rb') as f:
+            data = bytearray(f.read())
+    except OSError:
+        return None
+
+    width, height, stride = _HEADER.unpack_from(data)
+    if len(data) != _HEADER.size + stride * height:
+        return None
+    return cairocffi.ImageSurface.create_for_data(
+        memoryview(data)[_HEADER.size:], cairocffi.FORMAT_ARGB32, width, height, stride)
+
+
+def _render(path, height, cache, prefix):
+    img = Img.from_path(path)
+    img.resize(height=height)
+
+    surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, img.width, img.height)
+    ctx = cairocffi.Context(surface)
+    ctx.set_source(img.pattern)
+    ctx.paint()
+    surface.flush()
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # the previous versions of this icon at this height are stale now
+        for stale in glob('{}-*-{}.argb'.format(prefix, height)):
+            os.remove(stale)
+        tmp = cache + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(img.width, img.height, surface.get_stride()))
+            f.write(surface.get_data())
+        os.replace(tmp, cache)
+    except OSError:
+        logger.exception("Unable to cache the icon %s", path)
+
+    return surface
@@ -0,0 +1,174 @@
+import time
+from collections import deque
+
+import libqtile
+from libqtile.lazy import lazy
+
+from custom.stats import Percentiles
+
+
+class Launcher:
+    """
+    Spawns `command` and times it, from the key press to the first window
+    with one of the `wm_class` names managed (mapped) by qtile. That can't
+    be the spawned pid: emacsclient and kitty --single-instance hand the
+    window over to a running instance.
+
+    A press with no window after `timeout` seconds is not counted. A press
+    served from the pool (see `prewarm`) is timed apart, in `warm_timings`:
+    moving a window is not launching one.
+
+    With `prewarm` one more window is kept hidden in the pool group of
+    `Launchers`: a press moves it to the current group, a new one is
+    spawned in the background. `ready` (say the server socket of
+    emacsclient) is waited for before spawning one.
+
+    `title`, when set, is the window name too: the launchers of one program
+    (two emacsclient frames) tell their windows apart by it, and a window
+    with the title of one is not taken by those matching its class only.
+    """
+
+    def __init__(self, name, command, wm_class, timeout=30, samples=100,
+                 prewarm=False, ready=None, title=None):
+        self.name = name
+        self.command = command
+        if isinstance(wm_class, str):
+            wm_class = [wm_class]
+        self.wm_class = {c.lower() for c in wm_class}
+        self.title = title
+        self.timeout = timeout
+        self.timings = Percentiles(samples)
+        self.warm_timings = Percentiles(samples)
+        # times of the presses still waiting for their window
+        self.pending = deque()
+        self.prewarm = prewarm
+        self.ready = ready
+        # the hidden window of the pool, and when the next one was spawned
+        self.warm = None
+        self.warming = None
+
+    def launch(self, qtile):
+        if self.warm is not None and self.warm.wid in qtile.windows_map:
+            start = time.monotonic()
+            window, self.warm = self.warm, None
+            window.togroup(qtile.current_group.name)
+            self.warm_timings.record((time.monotonic() - start) * 1000)
+            self.refill(qtile)
+            return
+        self.pending.append(time.monotonic())
+        qtile.cmd_spawn(self.command)
+        # the pool was empty: the window after this one refills it
+        self.refill(qtile)
+
+    def refill(self, qtile, waited=0):
+        """ Spawn the next hidden window, once `ready` """
+        if not self.prewarm or self.warm is not None or self.warming is not None:
+            return
+        if self.ready is not None and not self.ready():
+            if waited < self.timeout:
+                qtile.call_later(0.5, self.refill, qtile, waited + 0.5)
+            return
+        self.warming = time.monotonic()
+        qtile.cmd_spawn(self.command)
+
+    def matches(self, window):
+        if self.title is not None and window.name != self.title:
+            return False
+        return any(c.lower() in self.wm_class for c in window.get_wm_class() or ())
+
+    def waiting_for(self, window, now):
+        """ The press `window` answers, None if it's not ours """
+        while self.pending and now - self.pending[0] > self.timeout:
+            self.pending.popleft()
+        if self.pending and self.matches(window):
+            return self.pending[0]
+        return None
+
+    def warms(self, window, now):
+        """ Whether `window` is the one spawned to refill the pool """
+        if self.warming is not None and now - self.warming > self.timeout:
+            self.warming = None
+        return self.warming is not None and self.matches(window)
+
+
+class Launchers:
+    """
+    The timed launchers of the config: `spawn` binds one, `managed` is
+    the client_managed hook and `expose` adds the command returning the
+    rolling percentiles of each:
+
+        qtile cmd-obj -o cmd -f launch_stats
+
+    The hidden windows of the prewarmed ones wait in the group `pool`
+    (not shown, give it no label): `prewarm` fills it at startup, `new`
+    (client_new) sends the windows there and `killed` (client_killed)
+    forgets those closed in the meantime.
+    """
+
+    def __init__(self, *launchers, pool='warm'):
+        self.launchers = {launcher.name: launcher for launcher in launchers}
+        self.pool = pool
+
+    def spawn(self, name):
+        """ lazy.spawn for the launcher `name`, timed """
+        return lazy.function(self.launchers[name].launch)
+
+    def claiming(self, window):
+        """ The launchers `window` may be from: those expecting its title, if any """
+        matching = [launcher for launcher in self.launchers.values() if launcher.matches(window)]
+        titled = [launcher for launcher in matching if launcher.title is not None]
+        return titled or matching
+
+    def managed(self, window):
+        # one window per press: with two emacsclient launchers, the window
+        # answers the oldest press
+        now = time.monotonic()
+        presses = []
+        for launcher in self.claiming(window):
+            pressed = launcher.waiting_for(window, now)
+            if pressed is not None:
+                presses.append((pressed, launcher))
+        if presses:
+            pressed, launcher = min(presses, key=lambda press: press[0])
+            launcher.pending.popleft()
+            launcher.timings.record((now - pressed) * 1000)
+
+    def new(self, window):
+        # a press waiting for its window comes before the pool
+        now = time.monotonic()
+        launchers = self.claiming(window)
+        if any(launcher.waiting_for(window, now) is not None for launcher in launchers):
+            return
+        for launcher in launchers:
+            if launcher.warms(window, now):
+                launcher.warming = None
+                launcher.warm = window
+                window.togroup(self.pool)
+                return
+
+    def killed(self, window):
+        for launcher in self.launchers.values():
+            if launcher.warm is window:
+                launcher.warm = None
+
+    def prewarm(self):
+        """ Fill the pool, adopting the windows a restart left in it """
+        qtile = libqtile.qtile
+        kept = qtile.groups_map[self.pool].windows
+        for launcher in self.launchers.values():
+            if not launcher.prewarm:
+                continue
+            for window in kept:
+                if launcher.warm is None and launcher.matches(window) and not any(
+                        other.warm is window for other in self.launchers.values()):
+                    launcher.warm = window
+            launcher.refill(qtile)
+
+    def expose(self):
+        """ Add the launch_stats command to qtile """
+        libqtile.qtile.cmd_launch_stats = self.cmd_launch_stats
+
+    def cmd_launch_stats(self, warm=False):
+        """ key to window latency of every launcher, of the pool hits with `warm` """
+        return {name: (launcher.warm_timings if warm else launcher.timings).info()
+                for name, launcher in self.launchers.items()}
@@ -1,16 +1,168 @@
+import json
+import os
+
+import libqtile
 from libqtile.layout.base import _SimpleLayoutBase
 from libqtile.layout.xmonad import MonadTall
 from libqtile.log_utils import logger
 
 
-class Max(_SimpleLayoutBase):
+# groups waiting for their coalesced layout_all
+_dirty = []
+
+
+def relayout(group):
+    """
+    Lay `group` out once the current event loop iteration is done, so the
+    commands of a key chord or a burst of key repeats share one pass.
+    """
+    if not _dirty:
+        libqtile.qtile.call_soon(_relayout)
+    if group not in _dirty:
+        _dirty.append(group)
+
+
+def _relayout():
+    groups = _dirty[:]
+    del _dirty[:]
+    for group in groups:
+        group.layout_all()
+
+
+STATE_FILE = os.path.expanduser('~/.cache/qtile/layouts.json')
+
+# {group name: {layout name: state}} saved by the previous instance, each
+# applied by the first pass of its layout; True while qtile starts up and
+# manages the windows again, one by one
+_pending = {}
+_starting = False
+
+
+def save_state():
+    """ Write the state of every layout that has one, before a restart """
+    state = {}
+    for group in libqtile.qtile.groups:
+        for layout in group.layouts:
+            if not hasattr(layout, 'state'):
+                continue
+            # never shown since the last restart: still the saved state
+            saved = _pending.get(group.name, {}).get(layout.name)
+            state.setdefault(group.name, {})[layout.name] = saved or layout.state()
+    try:
+        os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+        with open(STATE_FILE, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+    except OSError:
+        logger.exception("Unable to save the layout state")
+
+
+def load_state():
+    """
+    Read the state written before the restart: until `restore_state`, the
+    layouts of those groups skip their passes, qtile lays each window out
+    while it manages them one by one.
+    """
+    global _starting
+    try:
+        with open(STATE_FILE) as f:
+            _pending.update(json.load(f))
+        os.remove(STATE_FILE)
+    except (OSError, ValueError):
+        return
+    _starting = bool(_pending)
+
+
+def restore_state():
+    """ Once every window is managed: one pass for each visible group """
+    global _starting
+    if not _starting:
+        return
+    _starting = False
+    for screen in libqtile.qtile.screens:
+        if screen.group.name in _pending:
+            screen.group.layout_all()
+
+
+class _Restored:
+    """
+    Layouts with a `state()` to save across restarts and a `restore(state)`,
+    applied lazily by the first pass of the layout after the restart.
+    """
+
+    def _restoring(self):
+        """ Whether this pass should wait for the windows still managed """
+        saved = _pending.get(self.group.name, {})
+        if self.name not in saved:
+            return False
+        if _starting:
+            return True
+        self.restore(saved.pop(self.name))
+        return False
+
+    def state(self):
+        return dict(order=[client.wid for client in self.clients])
+
+    def restore(self, state):
+        # the windows opened since then go last
+        order = {wid: i for i, wid in enumerate(state['order'])}
+        current = self.clients.current_client
+        self.clients.clients.sort(key=lambda client: order.get(client.wid, len(order)))
+        if current is not None:
+            self.clients.current_client = current
+
+
+class _Placed:
+    """
+    place() sends a configure to the X server even when nothing moved:
+    remember the geometry last sent to each client and only send a new one.
+    A client that leaves a pass (floating, fullscreen) is placed by someone
+    else, so it is forgotten.
+    """
+
+    def clone(self, group):
+        c = super().clone(group)
+        c._placed = {}
+        return c
+
+    def _place(self, client, *geometry, above=False):
+        """ `above` also raises the client, in the same configure """
+        if above or self._placed.get(client) != geometry:
+            x, y, width, height, borderwidth, bordercolor, _, margin = geometry
+            client.place(x, y, width, height, borderwidth, bordercolor, above, margin)
+            self._placed[client] = geometry
+
+    def remove(self, client):
+        self._placed.pop(client, None)
+        return super().remove(client)
+
+    def layout(self, windows, screen_rect):
+        for client in self._placed.keys() - set(windows):
+            del self._placed[client]
+        super().layout(windows, screen_rect)
+
+
+class Max(_Restored, _Placed, _SimpleLayoutBase):
+    """
+    One window at a time. By default the others are unmapped; with
+    `stacking` every window stays mapped and switching only raises the new
+    one, so apps don't repaint from scratch and picom doesn't fade them.
+    """
+
     def __init__(self, **config):
         self.border_width = config.get('border_width')
         self.border_focus = config.get('border_focus')
         self.margin = config.get('margin')
+        self.stacking = config.get('stacking', False)
 
         _SimpleLayoutBase.__init__(self, **config)
 
+        # the client left visible by the last pass, and the screen and the
+        # windows of that pass; None until a full pass has placed (and
+        # hidden) every window
+        self._visible = None
+        self._laid_out = None
+        self._placed = {}
+
     def add(self, client):
         """
         WHEN: whenever a WINDOW is added to a GROUP and the LAYOUT is FOCUSED or
@@ -22,22 +174,79 @@ class Max(_SimpleLayoutBase):
         return super().add(client,
                            offset_to_current=1)
 
-    def configure(self, client, screen_rect):
+    def hide(self):
+        # the group left the screen (and hid every window) or switched to
+        # another layout, which placed the windows its own way
+        self._laid_out = None
+
+    def layout(self, windows, screen_rect):
+        """
+        A full pass places every window and hides all but the current one
+        (or, `stacking`, maps them all and raises the current one). Until
+        the windows or the screen change, a focus change only has to hide
+        the visible window and show the new one (or raise it).
+        """
+        if self._restoring():
+            return
+        current = self.clients.current_client if self.clients else None
+        shown = current if current in windows else None
+        laid_out = (screen_rect.x, screen_rect.y,
+                    screen_rect.width, screen_rect.height, tuple(windows))
+
+        if laid_out != self._laid_out:
+            super().layout(windows, screen_rect)
+            self._laid_out = laid_out
+        elif shown is not self._visible:
+            if self.stacking:
+                if shown is not None:
+                    self._raise(shown, screen_rect)
+            else:
+                if self._visible is not None:
+                    self._visible.hide()
+                if shown is not None:
+                    self.configure(shown, screen_rect)
+        self._visible = shown
+
+    def _place_client(self, client, screen_rect, above=False):
         # place() -  WINDOW CMD command
         # | X |  Y | width | heght | borderwidth | above | margin |
         # | 0 | 28 |  1920 |  1080 |           2 | False |      8 |
-        client.place(screen_rect.x,
-                     screen_rect.y,
-                     screen_rect.width - 2 * self.border_width,
-                     screen_rect.height - 2 * self.border_width,
-                     self.border_width,
-                     self.border_focus,
-                     False,
-                     self.margin
-                     )
+        self._place(client,
+                    screen_rect.x,
+                    screen_rect.y,
+                    screen_rect.width - 2 * self.border_width,
+                    screen_rect.height - 2 * self.border_width,
+                    self.border_width,
+                    self.border_focus,
+                    False,
+                    self.margin,
+                    above=above
+                    )
+
+    def _raise(self, client, screen_rect):
+        """
+        Raise `client` over the other tiled windows, in the same configure
+        as its geometry, and the group's floating windows (dialogs
+        included) back over it, as they are when the others are unmapped
+        """
+        self._place_client(client, screen_rect, above=True)
+        for window in self.group.windows:
+            if window.floating:
+                window.cmd_bring_to_front()
+
+    def configure(self, client, screen_rect):
+        current = bool(self.clients) and client is self.clients.current_client
+        if self.stacking and current:
+            self._raise(client, screen_rect)
+        else:
+            self._place_client(client, screen_rect)
 
         # "Focus" management
-        if self.clients and client is self.clients.current_client:
+        if self.stacking:
+            # mapped once and left mapped, only the stacking order changes
+            if client.hidden:
+                client.unhide()
+        elif current:
             client.unhide()
         else:
             client.hide()
@@ -51,7 +260,108 @@ class Max(_SimpleLayoutBase):
 
 class MaxFocus(Max): ...
 
-class Monad(MonadTall):
+class Monad(_Restored, _Placed, MonadTall):
+    def __init__(self, **config):
+        MonadTall.__init__(self, **config)
+        self._placed = {}
+        # the pane geometries of the last (n, ratio, relative_sizes, screen)
+        self._split_key = None
+        self._split = None
+
+    def state(self):
+        return dict(super().state(),
+                    ratio=self.ratio,
+                    align=self.align,
+                    relative_sizes=self.relative_sizes)
+
+    def restore(self, state):
+        super().restore(state)
+        self.ratio = state['ratio']
+        self.align = state['align']
+        # the sizes only fit the same number of secondary panes
+        if len(state['relative_sizes']) == len(self.clients) - 1:
+            self.relative_sizes = state['relative_sizes']
+            self.do_normalize = False
+
+    def layout(self, windows, screen_rect):
+        if self._restoring():
+            return
+        self.screen_rect = screen_rect
+        # normalized here rather than by the first configure, so the split
+        # is computed once with the final sizes
+        if self.clients and (not self.relative_sizes or self.do_normalize):
+            self.cmd_normalize(False)
+
+        key = (len(self.clients), self.ratio, tuple(self.relative_sizes), self.align,
+               screen_rect.x, screen_rect.y, screen_rect.width, screen_rect.height)
+        if key != self._split_key:
+            self._split = self._compute_split(screen_rect)
+            self._split_key = key
+        super().layout(windows, screen_rect)
+
+    def _compute_split(self, screen_rect):
+        """
+        (x, y, width, height, margin) of the main pane and of every
+        secondary pane, what MonadTall._configure_specific works out per
+        client, with the y offsets accumulated once instead of summed again
+        for each client.
+        """
+        width_main = int(screen_rect.width * self.ratio)
+        width_shared = screen_rect.width - width_main
+
+        if self.align == self._left:
+            x_main = screen_rect.x
+            x_secondary = screen_rect.x + width_main
+        else:
+            x_main = screen_rect.x + width_shared - self.margin
+            x_secondary = screen_rect.x
+
+        split = [(x_main, screen_rect.y, width_main, screen_rect.height,
+                  (self.margin, 2 * self.border_width,
+                   self.margin + 2 * self.border_width, self.margin))]
+
+        above = 0.0
+        for cidx, relative_size in enumerate(self.relative_sizes, 1):
+            ypos = screen_rect.y + self._get_absolute_size_from_relative(above)
+            height = self._get_absolute_size_from_relative(relative_size)
+            # fix double margin
+            if cidx > 1:
+                ypos -= self.margin
+                height += self.margin
+            split.append((x_secondary, ypos, width_shared - 2 * self.border_width,
+                          height - 2 * self.border_width, self.margin))
+            above += relative_size
+        return split
+
+    def configure(self, client, screen_rect):
+        "MonadTall.configure, through the geometry memo, mapping only hidden clients"
+        self.screen_rect = screen_rect
+        if not self.clients or client not in self.clients:
+            client.hide()
+            return
+
+        px = self.border_focus if client.has_focus else self.border_normal
+
+        if len(self.clients) == 1:
+            self._place(client,
+                        screen_rect.x,
+                        screen_rect.y,
+                        screen_rect.width - 2 * self.single_border_width,
+                        screen_rect.height - 2 * self.single_border_width,
+                        self.single_border_width,
+                        px,
+                        False,
+                        self.single_margin)
+        else:
+            self._configure_specific(client, screen_rect, px, self.clients.index(client))
+        # MonadTall maps every client again on every pass
+        if client.hidden:
+            client.unhide()
+
+    def _configure_specific(self, client, screen_rect, px, cidx):
+        x, y, width, height, margin = self._split[cidx]
+        self._place(client, x, y, width, height, self.border_width, px, False, margin)
+
     def cmd_normalize(self, redraw=True):
         "Evenly distribute screen-space among secondary clients"
         n = len(self.clients) - 1  # exclude main client, 0
@@ -60,7 +370,7 @@ class Monad(MonadTall):
             self.relative_sizes = [1.0 / n] * n
         # reset main pane ratio
         if redraw:
-            self.group.layout_all()
+            relayout(self.group)
         self.do_normalize = False
 
     def cmd_reset(self, redraw=True):
@@ -71,6 +381,91 @@ class Monad(MonadTall):
     def cmd_normalize_main(self, redraw=True):
         "Normalize main client"
         self.ratio = self._med_ratio
-        self.group.layout_all()
+        relayout(self.group)
+
+    def cmd_distribute(self, *weights):
+        """
+        Size the secondary clients in proportion to `weights`, the last one
+        repeated for the clients past them, in a single relayout:
+        distribute(2, 1) makes the first one twice as tall as the others
+        """
+        n = len(self.clients) - 1
+        if n < 1 or self.screen_rect is None or not weights:
+            return
+        weights = (list(weights) + [weights[-1]] * n)[:n]
+        total = sum(weights)
+        sizes = [w / total for w in weights]
+
+        # no client below min_secondary_size: each gets that much, and what
+        # is left is shared by weight
+        floor = min(self.min_secondary_size / self.screen_rect.height, 1.0 / n)
+        if min(sizes) < floor:
+            sizes = [floor + (1 - floor * n) * size for size in sizes]
+
+        self.relative_sizes = sizes
+        self.do_normalize = False
+        relayout(self.group)
+
+    def cmd_golden(self):
+        "Golden-ratio stack, each secondary client 1/φ as tall as the one above"
+        phi = (1 + 5 ** 0.5) / 2
+        self.cmd_distribute(*(phi ** -i for i in range(len(self.clients) - 1)))
+
+    # the resize commands of MonadTall, with one relayout for a burst of
+    # them (held u/i keys) instead of a layout_all each
+    def cmd_set_ratio(self, ratio):
+        "Directly set the main pane ratio"
+        self.ratio = max(self.min_ratio, min(self.max_ratio, ratio))
+        relayout(self.group)
+
+    def _maximize_main(self):
+        "Toggle the main pane between min and max size"
+        if self.ratio <= 0.5 * (self.max_ratio + self.min_ratio):
+            self.ratio = self.max_ratio
+        else:
+            self.ratio = self.min_ratio
+
+    def cmd_maximize(self):
+        "Grow the currently focused client to the max size"
+        if len(self.clients) < 3 or self.focused == 0:
+            self._maximize_main()
+        else:
+            self._maximize_secondary()
+        relayout(self.group)
+
+    def cmd_grow(self):
+        "Grow current window"
+        if self.focused == 0:
+            self._grow_main(self.change_ratio)
+        elif len(self.clients) == 2:
+            self._grow_solo_secondary(self.change_ratio)
+        else:
+            self._grow_secondary(self.change_size)
+        relayout(self.group)
+
+    def cmd_shrink(self):
+        "Shrink current window"
+        if self.focused == 0:
+            self._shrink_main(self.change_ratio)
+        elif len(self.clients) == 2:
+            self._shrink_solo_secondary(self.change_ratio)
+        else:
+            self._shrink_secondary(self.change_size)
+        relayout(self.group)
+
+    def cmd_grow_main(self):
+        "Grow main pane"
+        self._grow_main(self.change_ratio)
+        relayout(self.group)
+
+    def cmd_shrink_main(self):
+        "Shrink main pane"
+        self._shrink_main(self.change_ratio)
+        relayout(self.group)
+
+    def cmd_flip(self):
+        "Flip the layout horizontally"
+        self.align = self._left if self.align == self._right else self._right
+        relayout(self.group)
 
 class MonadFocus(Monad): ...
@@ -0,0 +1,410 @@
+import asyncio
+import os
+import struct
+
+from libqtile.log_utils import logger
+
+
+# pa_command_t values of the native protocol, the few we use
+ERROR = 0
+REPLY = 2
+AUTH = 8
+SET_CLIENT_NAME = 9
+GET_SINK_INFO = 21
+SUBSCRIBE = 35
+SET_SINK_VOLUME = 36
+SET_SINK_MUTE = 39
+SUBSCRIBE_EVENT = 66
+
+PROTOCOL_VERSION = 32
+CONTROL_CHANNEL = 0xFFFFFFFF
+INVALID_INDEX = 0xFFFFFFFF
+VOLUME_NORM = 0x10000
+DEFAULT_SINK = '@DEFAULT_SINK@'
+
+# subscription masks, and the facilities of the events they bring
+MASK_SINK = 0x0001
+MASK_SERVER = 0x0080
+FACILITY_MASK = 0x000F
+FACILITY_SINK = 0
+FACILITY_SERVER = 7
+
+
+class PulseError(Exception):
+    """ An error reply of the server """
+
+
+class CVolume(tuple):
+    """ A pa_cvolume: the volume of each channel """
+
+
+def pack(*values):
+    """
+    A tagstruct of `values`: int (uint32), str, None, bool, bytes, CVolume
+    and dict (a proplist of strings).
+    """
+    out = bytearray()
+    for value in values:
+        if value is None:
+            out += b'N'
+        elif isinstance(value, bool):
+            out += b'1' if value else b'0'
+        elif isinstance(value, int):
+            out += b'L' + struct.pack('>I', value)
+        elif isinstance(value, str):
+            out += b't' + value.encode() + b'\0'
+        elif isinstance(value, bytes):
+            out += b'x' + struct.pack('>I', len(value)) + value
+        elif isinstance(value, CVolume):
+            out += b'v' + struct.pack('>B{}I'.format(len(value)), len(value), *value)
+        elif isinstance(value, dict):
+            out += b'P'
+            for key, data in value.items():
+                data = data.encode() + b'\0'
+                out += pack(key, len(data), data)
+            out += b'N'
+        else:
+            raise TypeError("can't pack {!r}".format(value))
+    return bytes(out)
+
+
+def _read(data, i):
+    """ The value at `data[i]` and the offset after it """
+    tag = data[i:i + 1]
+    i += 1
+    if tag == b'L' or tag == b'V':
+        return struct.unpack_from('>I', data, i)[0], i + 4
+    if tag == b'B':
+        return data[i], i + 1
+    if tag == b'R' or tag == b'U':
+        return struct.unpack_from('>Q', data, i)[0], i + 8
+    if tag == b'r':
+        return struct.unpack_from('>q', data, i)[0], i + 8
+    if tag == b't':
+        end = data.index(b'\0', i)
+        return data[i:end].decode(errors='replace'), end + 1
+    if tag == b'N':
+        return None, i
+    if tag == b'1' or tag == b'0':
+        return tag == b'1', i
+    if tag == b'x':
+        size = struct.unpack_from('>I', data, i)[0]
+        return data[i + 4:i + 4 + size], i + 4 + size
+    if tag == b'a':
+        # sample format, channels, rate
+        return struct.unpack_from('>BBI', data, i), i + 6
+    if tag == b'v':
+        channels = data[i]
+        return (CVolume(struct.unpack_from('>{}I'.format(channels), data, i + 1)),
+                i + 1 + 4 * channels)
+    if tag == b'm':
+        channels = data[i]
+        return tuple(data[i + 1:i + 1 + channels]), i + 1 + channels
+    if tag == b'T':
+        return struct.unpack_from('>II', data, i), i + 8
+    if tag == b'P':
+        props = {}
+        while data[i:i + 1] != b'N':
+            key, i = _read(data, i)
+            _, i = _read(data, i)
+            value, i = _read(data, i)
+            props[key] = value.rstrip(b'\0').decode(errors='replace')
+        return props, i + 1
+    if tag == b'f':
+        # a format info: its encoding and proplist follow as values of their own
+        return _read(data, i)
+    raise ValueError("unknown tag {!r}".format(tag))
+
+
+def unpack(data):
+    """ The values of a tagstruct, up to the first tag newer than this module """
+    values = []
+    i = 0
+    while i < len(data):
+        try:
+            value, i = _read(data, i)
+        except (ValueError, IndexError, struct.error):
+            break
+        values.append(value)
+    return values
+
+
+def frame(payload):
+    """ A control packet: the descriptor, then the tagstruct """
+    return struct.pack('>5I', len(payload), CONTROL_CHANNEL, 0, 0, 0) + payload
+
+
+def socket_path(server=None):
+    """ The native socket of `server`, PULSE_SERVER or the user's """
+    server = server or os.environ.get('PULSE_SERVER', '').split(' ')[0]
+    if server:
+        # only local servers: 'unix:/path' or a path
+        return server[len('unix:'):] if server.startswith('unix:') else server
+    runtime = os.environ.get('XDG_RUNTIME_DIR', '/run/user/{}'.format(os.getuid()))
+    return os.path.join(runtime, 'pulse', 'native')
+
+
+def read_cookie():
+    for path in (os.environ.get('PULSE_COOKIE'), '~/.config/pulse/cookie', '~/.pulse-cookie'):
+        if not path:
+            continue
+        try:
+            with open(os.path.expanduser(path), 'rb') as f:
+                return f.read(256)
+        except OSError:
+            continue
+    # pipewire-pulse does not check it
+    return bytes(256)
+
+
+class Pulse:
+    """
+    One connection to the sound server for the volume keys and the volume
+    widget, speaking the native protocol itself: no libpulse main loop to
+    poll, no amixer or pactl process per change. The default sink is kept
+    up to date from the change events the server sends.
+
+    `change` and `toggle_mute` never wait on the server. They move a
+    target, and the sink is set to the latest target once the request
+    before it is answered: a held key sends one request per round trip,
+    not one per repeat, and the requests are answered in order. Listeners
+    (`subscribe`) are called with (volume percent, muted) on every change,
+    the targets included; the volume is None while disconnected.
+    """
+
+    def __init__(self, server=None, limit=100, reconnect_delay=10):
+        self.server = server
+        self.limit = limit
+        self.reconnect_delay = reconnect_delay
+        # {'index', 'name', 'values', 'muted', 'base'} of the default sink
+        self.sink = None
+        self.volume = None
+        self.muted = False
+        self._target = None
+        self._mute_target = None
+        self._listeners = []
+        self._task = None
+        self._writer = None
+        self._tag = 0
+        self._replies = {}
+        self._flushing = False
+        self._stale = False
+        self._refreshing = False
+
+    def subscribe(self, listener):
+        """ Call `listener(volume, muted)` on every change, and right away """
+        self._listeners.append(listener)
+        self.start()
+        listener(self.volume, self.muted)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def start(self):
+        """ Connect, from the event loop, unless connected or connecting """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def change(self, step):
+        """ Move the volume `step` percent, from the last target """
+        if self.sink is None:
+            self.start()
+            return
+        volume = self._target if self._target is not None else self._percent(self.sink['values'])
+        self._target = max(0, min(self.limit, volume + step))
+        self._publish()
+        self._flush_soon()
+
+    def toggle_mute(self):
+        if self.sink is None:
+            self.start()
+            return
+        muted = self._mute_target if self._mute_target is not None else self.sink['muted']
+        self._mute_target = not muted
+        self._publish()
+        self._flush_soon()
+
+    def _percent(self, values):
+        return round(max(values, default=0) * 100 / self.sink['base'])
+
+    def _scaled(self, percent):
+        """ The sink volume for `percent`, keeping the balance of the channels """
+        values = self.sink['values']
+        volume = round(self.sink['base'] * percent / 100)
+        top = max(values, default=0)
+        if not top:
+            return CVolume([volume] * len(values))
+        return CVolume(round(value * volume / top) for value in values)
+
+    def _publish(self):
+        if self.sink is None:
+            volume, muted = None, False
+        else:
+            volume = self._target if self._target is not None else self._percent(self.sink['values'])
+            muted = self._mute_target if self._mute_target is not None else self.sink['muted']
+        if (volume, muted) == (self.volume, self.muted):
+            return
+        self.volume, self.muted = volume, muted
+        for listener in list(self._listeners):
+            try:
+                listener(volume, muted)
+            except Exception:
+                logger.exception("pulse: %r failed to handle a change", listener)
+
+    async def _run(self):
+        while True:
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                self._disconnected()
+                raise
+            except (OSError, EOFError, PulseError) as e:
+                logger.warning("pulse: %s, reconnecting in %ss", e or type(e).__name__,
+                               self.reconnect_delay)
+            self._disconnected()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _session(self):
+        reader, self._writer = await asyncio.open_unix_connection(socket_path(self.server))
+        reading = asyncio.ensure_future(self._read(reader))
+        try:
+            await self._request(AUTH, PROTOCOL_VERSION, read_cookie())
+            await self._request(SET_CLIENT_NAME, {'application.name': 'qtile'})
+            await self._request(SUBSCRIBE, MASK_SINK | MASK_SERVER)
+            await self._fetch()
+            await reading
+        finally:
+            reading.cancel()
+            self._writer.close()
+
+    def _disconnected(self):
+        for future in self._replies.values():
+            future.cancel()
+        self._replies.clear()
+        self._writer = None
+        self.sink = None
+        self._target = self._mute_target = None
+        self._publish()
+
+    async def _read(self, reader):
+        try:
+            while True:
+                length, channel, _, _, _ = struct.unpack('>5I', await reader.readexactly(20))
+                payload = await reader.readexactly(length)
+                if channel != CONTROL_CHANNEL:
+                    continue
+                command, tag, *values = unpack(payload)
+                if command == SUBSCRIBE_EVENT:
+                    self._on_event(*values[:2])
+                    continue
+                future = self._replies.pop(tag, None)
+                if future is None or future.done():
+                    continue
+                if command == ERROR:
+                    future.set_exception(PulseError("error {}".format(values[0] if values else '?')))
+                else:
+                    future.set_result(values)
+        except Exception as e:
+            # the requests waiting for a reply fail with the connection
+            for future in self._replies.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection lost: {}".format(e)))
+            self._replies.clear()
+            raise
+
+    def _request(self, command, *args):
+        """ Send a command, the future of the values of its reply """
+        self._tag = (self._tag + 1) & 0x7FFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._replies[self._tag] = future
+        self._writer.write(frame(pack(command, self._tag, *args)))
+        return future
+
+    async def _fetch(self):
+        info = await self._request(GET_SINK_INFO, INVALID_INDEX, DEFAULT_SINK)
+        # index, name, description, sample spec, channel map, owner module,
+        # volume, mute, (monitor, latency, driver, flags, proplist...)
+        # and the base volume 16th
+        self.sink = {
+            'index': info[0],
+            'name': info[1],
+            'values': info[6],
+            'muted': info[7],
+            'base': info[15] if len(info) > 15 and info[15] else VOLUME_NORM,
+        }
+        self._publish()
+
+    def _on_event(self, event, index):
+        facility = event & FACILITY_MASK
+        # the server's events: the default sink may have changed
+        if facility == FACILITY_SERVER or (
+                facility == FACILITY_SINK and (self.sink is None or index == self.sink['index'])):
+            self._stale = True
+            if not self._refreshing:
+                self._refreshing = True
+                asyncio.get_running_loop().create_task(self._refresh())
+
+    async def _refresh(self):
+        # the events of a burst of changes, one fetch in flight at a time
+        try:
+            while self._stale:
+                self._stale = False
+                await self._fetch()
+        except (ConnectionError, asyncio.CancelledError, PulseError):
+            pass
+        finally:
+            self._refreshing = False
+
+    def _flush_soon(self):
+        if not self._flushing and self._writer is not None:
+            self._flushing = True
+            asyncio.get_running_loop().create_task(self._flush())
+
+    def _applied(self, sink, key, value):
+        # a fetch answered while the request was in flight replaced the sink
+        # with what it was before the request
+        if self.sink is not None and self.sink['index'] == sink['index']:
+            self.sink[key] = value
+
+    async def _flush(self):
+        """ Send the targets, one request in flight, until they are reached """
+        try:
+            while self.sink is not None:
+                sink = self.sink
+                if self._target is not None:
+                    target = self._target
+                    if target != self._percent(sink['values']):
+                        values = self._scaled(target)
+                        await self._request(SET_SINK_VOLUME, sink['index'], None, values)
+                        self._applied(sink, 'values', values)
+                    # not moved again while this was sent
+                    if self._target == target:
+                        self._target = None
+                elif self._mute_target is not None:
+                    muted = self._mute_target
+                    if muted != sink['muted']:
+                        await self._request(SET_SINK_MUTE, sink['index'], None, muted)
+                        self._applied(sink, 'muted', muted)
+                    if self._mute_target == muted:
+                        self._mute_target = None
+                else:
+                    break
+                self._publish()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except PulseError as e:
+            logger.warning("pulse: unable to set the volume: %s", e)
+            self._target = self._mute_target = None
+            self._publish()
+        finally:
+            self._flushing = False
+
+
+# shared by the volume keys and widgets of the config
+pulse = Pulse()
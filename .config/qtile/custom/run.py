@@ -0,0 +1,212 @@
+import json
+import os
+import time
+
+from libqtile.log_utils import logger
+
+
+INDEX_FILE = os.path.expanduser('~/.cache/qtile/run_index.json')
+FRECENCY_FILE = os.path.expanduser('~/.cache/qtile/run_frecency.json')
+DEFAULT_PATH = '/bin:/usr/bin:/usr/local/bin'
+
+# (age in days, weight) of a launch, the newest first
+WEIGHTS = [(4, 100), (14, 70), (31, 50), (90, 30)]
+OLD_WEIGHT = 10
+# launch times kept per program, and for how long a program is remembered
+KEEP_LAUNCHES = 10
+FORGET_DAYS = 365
+
+DAY = 24 * 60 * 60
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(path, data):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, path)
+    except OSError:
+        logger.exception("Unable to save %s", path)
+
+
+class Executables:
+    """
+    The executables of PATH, listed once per directory and again only when
+    the directory's mtime changes (a program installed, removed or
+    renamed; not a chmod). The listings are kept in `path`, so a restart
+    does not list them again either.
+    """
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        # {directory: [mtime_ns, [names]]}
+        self.dirs = None
+
+    def names(self):
+        """ Every executable name, once, as PATH would find them """
+        if self.dirs is None:
+            self.dirs = _load(self.path)
+
+        changed = False
+        names = {}
+        for directory in os.environ.get('PATH', DEFAULT_PATH).split(':'):
+            directory = os.path.expanduser(directory)
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            listing = self.dirs.get(directory)
+            if listing is None or listing[0] != mtime:
+                listing = self.dirs[directory] = [mtime, self.list(directory)]
+                changed = True
+            names.update(dict.fromkeys(listing[1]))
+
+        if changed:
+            _save(self.path, self.dirs)
+        return list(names)
+
+    @staticmethod
+    def list(directory):
+        names = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and os.access(entry.path, os.X_OK):
+                            names.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return sorted(names)
+
+
+class Frecency:
+    """
+    When each program was last launched from the prompt, in `path`: a
+    program launched often and lately scores highest, each launch weighing
+    less as it ages (see WEIGHTS).
+    """
+
+    def __init__(self, path=FRECENCY_FILE):
+        self.path = path
+        # {program: [launch times]}
+        self.launches = None
+
+    def _loaded(self):
+        if self.launches is None:
+            self.launches = _load(self.path)
+        return self.launches
+
+    def score(self, program, now):
+        score = 0
+        for launched in self._loaded().get(program, ()):
+            age = (now - launched) / DAY
+            score += next((weight for days, weight in WEIGHTS if age < days), OLD_WEIGHT)
+        return score
+
+    def record(self, program):
+        now = time.time()
+        launches = self._loaded()
+        launches[program] = (launches.get(program, []) + [now])[-KEEP_LAUNCHES:]
+        # the file stays small: programs not launched for a year are forgotten
+        for name in [name for name, times in launches.items()
+                     if now - times[-1] > FORGET_DAYS * DAY]:
+            del launches[name]
+        _save(self.path, launches)
+
+
+class Runner:
+    """
+    DmenuRun in process: `prompt` reads a command in a RunPrompt widget,
+    whose Tab completes the executables of PATH, the most frecent first,
+    and qtile spawns it without a shell.
+
+    The executables are listed and ranked once per prompt, by `start`; as
+    the text typed grows, the matches are narrowed from the previous ones.
+    """
+
+    def __init__(self):
+        self.executables = Executables()
+        self.frecency = Frecency()
+        # every executable, the most frecent first; the last text matched
+        # and its matches
+        self.ranked = None
+        self.prefix = ''
+        self.last = []
+
+    def start(self):
+        """ List and rank the executables again, for a new prompt """
+        now = time.time()
+        names = self.executables.names()
+        scores = {name: self.frecency.score(name, now) for name in names}
+        self.ranked = sorted(names, key=lambda name: (-scores[name], name))
+        self.prefix = ''
+        self.last = self.ranked
+
+    def matches(self, text):
+        """ The executables starting with `text`, the most frecent first """
+        if self.ranked is None:
+            self.start()
+        names = self.last if text.startswith(self.prefix) else self.ranked
+        self.last = [name for name in names if name.startswith(text)]
+        self.prefix = text
+        return list(self.last)
+
+    def run(self, qtile, command):
+        command = command.strip()
+        if not command:
+            return
+        self.frecency.record(os.path.basename(command.split()[0]))
+        qtile.cmd_spawn(command)
+
+    def prompt(self, qtile, widget='runprompt', text='run'):
+        """ For lazy.function: read a command and run it """
+        try:
+            prompt = qtile.widgets_map[widget]
+        except KeyError:
+            logger.error("No widget named '%s' present.", widget)
+            return
+        prompt.start_input(text, lambda command: self.run(qtile, command), 'run')
+
+
+class RunCompleter:
+    """
+    widget.Prompt completion of the program name with the matches of the
+    runner, in order; a text with arguments or a path is left as is.
+    """
+
+    def __init__(self, qtile):
+        self.lookup = None
+        self.offset = -1
+        self.thisfinal = None
+
+    def actual(self):
+        return self.thisfinal
+
+    def reset(self):
+        self.lookup = None
+        self.offset = -1
+
+    def complete(self, txt):
+        if self.lookup is None:
+            self.lookup = [] if ' ' in txt or '/' in txt else runner.matches(txt)
+            # cycling through the matches comes back to the text typed
+            self.lookup.append(txt)
+            self.offset = -1
+        self.offset = (self.offset + 1) % len(self.lookup)
+        self.thisfinal = self.lookup[self.offset]
+        return self.thisfinal
+
+
+# shared by the run key and the RunPrompt widget
+runner = Runner()
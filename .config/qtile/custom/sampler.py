@@ -0,0 +1,386 @@
+import os
+import re
+import threading
+from collections import namedtuple
+from functools import partial
+from glob import glob
+from os.path import basename, dirname, join
+
+from libqtile.log_utils import logger
+
+from custom.ticker import wheel
+
+
+# same fields as psutil.cpu_freq(), in MHz
+CPUFreq = namedtuple('CPUFreq', 'current min max')
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def _cpu_number(path):
+    return int(re.search(r'cpu(\d+)', path).group(1))
+
+
+class PsutilCPU:
+    """ Load and frequency through psutil """
+
+    def __init__(self):
+        # imported here so the 'proc' path never pays for it
+        import psutil
+        self.psutil = psutil
+
+    def read(self, snapshot):
+        # one read of /proc/stat for both the cores and the aggregate
+        percpu = self.psutil.cpu_percent(percpu=True)
+        snapshot['cpu_percpu'] = percpu
+        snapshot['cpu_percent'] = sum(percpu) / len(percpu)
+        snapshot['cpu_freq'] = self.psutil.cpu_freq()
+
+
+class ProcCPU:
+    """
+    Load and frequency without psutil: /proc/stat and the cpufreq nodes are
+    opened once and re-read with os.pread on every tick.
+    """
+
+    def __init__(self):
+        self.stat = os.open('/proc/stat', os.O_RDONLY)
+
+        paths = sorted(glob('/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq'),
+                       key=_cpu_number)
+        self.freqs = [os.open(path, os.O_RDONLY) for path in paths]
+        if paths:
+            cpufreq = dirname(paths[0])
+            self.freq_min = self._read_khz(join(cpufreq, 'cpuinfo_min_freq'))
+            self.freq_max = self._read_khz(join(cpufreq, 'cpuinfo_max_freq'))
+            self.cpuinfo = None
+        else:
+            # no cpufreq driver (VMs): the 'cpu MHz' lines, like psutil
+            self.freq_min = self.freq_max = 0.0
+            self.cpuinfo = os.open('/proc/cpuinfo', os.O_RDONLY)
+
+        # previous (busy, total) jiffies of each core
+        self.last = None
+
+    @staticmethod
+    def _read_khz(path):
+        try:
+            return int(_read(path)) / 1000
+        except (OSError, ValueError):
+            return 0.0
+
+    def read(self, snapshot):
+        times = []
+        for line in os.pread(self.stat, 65536, 0).split(b'\n'):
+            if not line.startswith(b'cpu'):
+                break
+            if line[3] == 32:  # b' ', the aggregate line
+                continue
+            # user nice system idle iowait irq softirq steal (guest is in user)
+            fields = [int(f) for f in line.split()[1:9]]
+            total = sum(fields)
+            times.append((total - fields[3] - fields[4], total))
+
+        last = self.last or [(0, 0)] * len(times)
+        percpu = []
+        for (busy, total), (last_busy, last_total) in zip(times, last):
+            elapsed = total - last_total
+            percpu.append(round((busy - last_busy) / elapsed * 100, 1) if elapsed else 0.0)
+        self.last = times
+
+        snapshot['cpu_percpu'] = percpu
+        snapshot['cpu_percent'] = sum(percpu) / len(percpu)
+        snapshot['cpu_freq'] = CPUFreq(self.read_freq(), self.freq_min, self.freq_max)
+
+    def read_freq(self):
+        """ Average current frequency in MHz """
+        if self.cpuinfo is not None:
+            mhz = [float(line.split(b':')[1])
+                   for line in os.pread(self.cpuinfo, 1 << 20, 0).split(b'\n')
+                   if line.startswith(b'cpu MHz')]
+        else:
+            mhz = [int(os.pread(fd, 32, 0)) / 1000 for fd in self.freqs]
+        return sum(mhz) / len(mhz) if mhz else 0.0
+
+
+class Meminfo:
+    """
+    /proc/meminfo as {field: bytes}. The file is opened once and re-read with
+    os.preadv into the same buffer; only the `select`ed fields are parsed.
+    """
+
+    def __init__(self):
+        self.fd = os.open('/proc/meminfo', os.O_RDONLY)
+        # buf[0] stays a newline so every field is found at a line start
+        # ('Active:' is also the end of 'Inactive:')
+        self.buf = bytearray(b'\n' * 8192)
+        self.keys = []
+
+    def select(self, fields):
+        self.keys = [(field, b'\n' + field.encode() + b':') for field in fields]
+
+    def read(self, snapshot):
+        buf = self.buf
+        size = os.preadv(self.fd, [memoryview(buf)[1:]], 0) + 1
+        if size == len(buf):
+            # the kernel has more fields than we have room for
+            self.buf = bytearray(b'\n' * (2 * len(buf)))
+            return self.read(snapshot)
+
+        meminfo = {}
+        for field, key in self.keys:
+            start = buf.find(key, 0, size)
+            if start < 0:
+                continue
+            start += len(key)
+            end = buf.find(b'\n', start, size)
+            # '   1234 kB', a few fields (HugePages_*) are counts without kB
+            unit = buf.find(b'k', start, end)
+            if unit < 0:
+                meminfo[field] = int(buf[start:end])
+            else:
+                meminfo[field] = int(buf[start:unit]) * 1024
+        snapshot['meminfo'] = meminfo
+
+
+class Temps:
+    """
+    sysfs temperatures as {label: celsius}, labelled the way psutil (and so
+    widget.ThermalSensor) does: the tempN_label, or '<chip>-<index>'. The
+    inputs of the `select`ed labels are kept open and re-read with os.preadv.
+    """
+
+    def __init__(self):
+        self.sensors = []
+        empty_index = 0
+
+        for path in sorted(glob('/sys/class/hwmon/hwmon*/temp*_input')):
+            try:
+                label = _read(path.replace('_input', '_label'))
+            except OSError:
+                try:
+                    chip = _read(join(dirname(path), 'name'))
+                except OSError:
+                    chip = 'UNKNOWN'
+                label = '{}-{}'.format(chip, empty_index)
+                empty_index += 1
+            self.sensors.append((label, path))
+
+        # no hwmon, fall back to the ACPI thermal zones
+        if not self.sensors:
+            for zone in sorted(glob('/sys/class/thermal/thermal_zone*')):
+                try:
+                    label = _read(join(zone, 'type'))
+                except OSError:
+                    label = basename(zone)
+                self.sensors.append((label, join(zone, 'temp')))
+
+        self.buf = bytearray(16)
+        self.fds = []
+        self._open = {}
+
+    def select(self, labels):
+        # kept open once opened, for the label to be selected again
+        for label, path in self.sensors:
+            if label in labels and label not in self._open:
+                self._open[label] = os.open(path, os.O_RDONLY)
+        self.fds = [(label, fd) for label, fd in self._open.items() if label in labels]
+
+    def read(self, snapshot):
+        buf = self.buf
+        temps = {}
+        for label, fd in self.fds:
+            try:
+                size = os.preadv(fd, [buf], 0)
+                temps[label] = int(buf[:size]) / 1000
+            except (OSError, ValueError):
+                continue
+        snapshot['temps'] = temps
+
+
+class Sampler:
+    """
+    One thread reading the system counters for every bar widget.
+
+    Widgets subscribe with the sources they display (keys of `readers`),
+    and with `fields` ({source: names}) for the readers that can parse only
+    part of their source. Each source is read at the update_interval of its
+    fastest subscriber, on the ticks of the timer wheel: the sources due on
+    one tick are read together, once, and the snapshot is published to
+    their subscribers from the event loop.
+
+    While none of its subscribers' text changes a source backs off,
+    doubling its interval up to `max_interval`; the first change brings it
+    back to its update_interval.
+    """
+
+    readers = {
+        'cpu': PsutilCPU,
+        'proc_cpu': ProcCPU,
+        'meminfo': Meminfo,
+        'temps': Temps,
+    }
+
+    def __init__(self, max_interval=8.0):
+        # the latest values of every source
+        self.snapshot = {'sources': frozenset()}
+        # source -> its current (backed off) interval
+        self.intervals = {}
+        self.max_interval = max_interval
+        # source -> update_interval of its fastest subscriber, samples
+        # since one of them last changed, its wheel callback
+        self._base = {}
+        self._idle = {}
+        self._ticks = {}
+        self._subscribers = []
+        self._readers = {}
+        # held to set up a reader, change its fields, hand over or read the
+        # due sources: the event loop does the first two, the thread reads
+        self._lock = threading.Lock()
+        self._due = set()
+        self._waking = False
+        self._qtile = None
+        self._stop = None
+        self._wakeup = threading.Event()
+
+    def subscribe(self, widget):
+        """ Start feeding `widget.on_sample`, starting the thread if needed """
+        self._qtile = widget.qtile
+        self._subscribers.append(widget)
+        self._update()
+        # the new widget should not wait for a backed off tick
+        with self._lock:
+            self._due.update(widget.sources)
+        self._wakeup.set()
+
+        if self._stop is None:
+            self._stop = threading.Event()
+            threading.Thread(target=self._run,
+                             args=(self._stop,),
+                             name='sampler',
+                             daemon=True).start()
+
+    def unsubscribe(self, widget):
+        if widget in self._subscribers:
+            self._subscribers.remove(widget)
+        self._update()
+
+        # nobody is reading, let the thread die
+        if not self._subscribers and self._stop is not None:
+            self._stop.set()
+            self._stop = None
+            self._wakeup.set()
+
+    def tick(self, source):
+        """ Read `source` with the others due in this event loop iteration """
+        with self._lock:
+            self._due.add(source)
+        if not self._waking:
+            self._waking = True
+            self._qtile.call_soon(self._wake)
+
+    def _wake(self):
+        self._waking = False
+        self._wakeup.set()
+
+    def _set_interval(self, source, interval):
+        if interval == self.intervals.get(source):
+            return
+        if source in self.intervals:
+            wheel.cancel(self.intervals.pop(source), self._ticks[source])
+        if interval is not None:
+            if source not in self._ticks:
+                self._ticks[source] = partial(self.tick, source)
+            self.intervals[source] = interval
+            wheel.every(interval, self._ticks[source])
+
+    def _update(self):
+        base = {}
+        for widget in self._subscribers:
+            for source in widget.sources:
+                base[source] = min(base.get(source, widget.update_interval),
+                                   widget.update_interval)
+        with self._lock:
+            for source in base:
+                reader = self._reader(source)
+                if hasattr(reader, 'select'):
+                    reader.select({f for w in self._subscribers
+                                   for f in getattr(w, 'fields', {}).get(source, ())})
+            self._due &= set(base)
+
+        for source in set(self._base) - set(base):
+            self._set_interval(source, None)
+            del self._base[source], self._idle[source]
+        for source, interval in base.items():
+            if interval != self._base.get(source):
+                self._base[source] = interval
+                self._idle[source] = 0
+                self._set_interval(source, interval)
+
+    def _run(self, stop):
+        while not stop.is_set():
+            # until the next tick of the wheel
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if stop.is_set():
+                break
+            try:
+                snapshot = self.sample()
+            except Exception:
+                logger.exception("sampler failed to read the system counters")
+            else:
+                if snapshot['sources']:
+                    self._qtile.call_soon_threadsafe(self._publish, snapshot)
+
+    def _publish(self, snapshot):
+        sampled = snapshot['sources']
+        self.snapshot.update(snapshot)
+        self.snapshot['sources'] = known = self.snapshot['sources'] | sampled
+        changed = set()
+        for widget in list(self._subscribers):
+            # a sample of other sources, or not of all of its own yet
+            if sampled.isdisjoint(widget.sources) or not known.issuperset(widget.sources):
+                continue
+            try:
+                if widget.on_sample(self.snapshot):
+                    changed.update(widget.sources)
+            except Exception:
+                logger.exception("%s failed to handle a sample", widget.name)
+
+        for source in sampled:
+            # unsubscribed since
+            if source not in self._base:
+                continue
+            base = self._base[source]
+            if source in changed:
+                self._idle[source] = 0
+            else:
+                self._idle[source] = min(self._idle[source] + 1, 16)
+            self._set_interval(source, min(base * 2 ** self._idle[source],
+                                           max(self.max_interval, base)))
+
+    def reader(self, source):
+        """ The reader of `source`, set up on first use """
+        with self._lock:
+            return self._reader(source)
+
+    def _reader(self, source):
+        if source not in self._readers:
+            self._readers[source] = self.readers[source]()
+        return self._readers[source]
+
+    def sample(self):
+        """ Read the sources due """
+        with self._lock:
+            sources, self._due = frozenset(self._due), set()
+            snapshot = {'sources': sources}
+            for source in sources:
+                self._reader(source).read(snapshot)
+        return snapshot
+
+
+# shared by every widget in custom.widgets
+sampler = Sampler()
@@ -0,0 +1,118 @@
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from time import perf_counter
+
+from libqtile.log_utils import logger
+
+
+class Timings:
+    """
+    Count, total, max and a fixed-bucket histogram of call durations: one
+    bisect and a few additions per call, nothing allocated.
+    """
+
+    # upper bounds of the buckets, in ms, the last one catches the rest
+    buckets = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(self.buckets) + 1)
+
+    def record(self, ms):
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+        self.histogram[bisect_left(self.buckets, ms)] += 1
+
+    def info(self):
+        labels = ['<={}ms'.format(b) for b in self.buckets]
+        labels.append('>{}ms'.format(self.buckets[-1]))
+        return dict(
+            count=self.count,
+            mean_ms=round(self.total / self.count, 3) if self.count else 0.0,
+            max_ms=round(self.max, 3),
+            histogram=dict(zip(labels, self.histogram)),
+        )
+
+
+class Percentiles:
+    """
+    The last `size` samples, for rolling percentiles: sorted when asked
+    for, which is rare, not when recorded.
+    """
+
+    def __init__(self, size=100):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+
+    def record(self, ms):
+        self.count += 1
+        self.samples.append(ms)
+
+    def info(self):
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 1)
+
+        return dict(
+            count=self.count,
+            p50_ms=percentile(50),
+            p90_ms=percentile(90),
+            p99_ms=percentile(99),
+            max_ms=round(ordered[-1], 1) if ordered else 0.0,
+        )
+
+
+def _timed(widget, name, timings, slow_ms):
+    method = getattr(widget, name)
+
+    @wraps(method)
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            ms = (perf_counter() - start) * 1000
+            timings.record(ms)
+            if slow_ms is not None and ms > slow_ms:
+                logger.warning("%s: slow %s took %.1fms", widget.name, name, ms)
+
+    return timed
+
+
+def instrument(widget, slow_ms=50, methods=('poll', 'draw')):
+    """
+    Time the `methods` of `widget` it has, logging the calls slower than
+    `slow_ms` (None to never log), and add a `stats` command returning the
+    timings:
+
+        qtile cmd-obj -o widget cpu -f stats
+    """
+    widget.timings = {}
+    for name in methods:
+        if callable(getattr(widget, name, None)):
+            timings = widget.timings[name] = Timings()
+            # instance attributes, so every self.poll()/self.draw() is timed,
+            # and the callbacks the widget registers later
+            setattr(widget, name, _timed(widget, name, timings, slow_ms))
+
+    def cmd_stats(reset=False):
+        """ Timings of this widget by method, `reset` starts them over """
+        stats = {name: timings.info() for name, timings in widget.timings.items()}
+        if reset:
+            for timings in widget.timings.values():
+                timings.reset()
+        return stats
+
+    widget.cmd_stats = cmd_stats
+    return widget
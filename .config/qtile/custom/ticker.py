@@ -0,0 +1,94 @@
+import time
+
+import libqtile
+from libqtile.log_utils import logger
+
+
+class TimerWheel:
+    """
+    One timer for every time-based widget.
+
+    Callbacks run on wall-clock multiples of their period, so a 1s and a
+    60s callback fire together at the minute instead of drifting apart.
+    Widgets `invalidate` instead of drawing: what changes within `settle`
+    seconds (a tick and the samples it triggers) is drawn in one frame, and
+    each frame repaints only the widgets it damaged, or their bar when one
+    of them changed length.
+    """
+
+    def __init__(self, settle=0.02):
+        self.settle = settle
+        # period -> callbacks, period -> next wall-clock deadline
+        self._callbacks = {}
+        self._deadlines = {}
+        self._timer = None
+        # widget -> whether its length changed
+        self._dirty = {}
+        self._frame = None
+
+    @staticmethod
+    def _next(period, now):
+        return now - now % period + period
+
+    def every(self, period, callback):
+        """ Run `callback` at every multiple of `period` seconds """
+        if period not in self._callbacks:
+            self._callbacks[period] = []
+            self._deadlines[period] = self._next(period, time.time())
+        self._callbacks[period].append(callback)
+        self._schedule()
+
+    def cancel(self, period, callback):
+        callbacks = self._callbacks.get(period, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks and period in self._callbacks:
+            del self._callbacks[period]
+            del self._deadlines[period]
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._deadlines:
+            delay = max(min(self._deadlines.values()) - time.time(), 0)
+            self._timer = libqtile.qtile.call_later(delay, self._tick)
+
+    def _tick(self):
+        self._timer = None
+        # the event loop clock may fire a hair early
+        now = time.time() + 0.005
+        for period, deadline in list(self._deadlines.items()):
+            if period not in self._deadlines or deadline > now:
+                continue
+            self._deadlines[period] = self._next(period, now)
+            for callback in list(self._callbacks[period]):
+                try:
+                    callback()
+                except Exception:
+                    logger.exception("timer wheel callback failed")
+        self._schedule()
+
+    def invalidate(self, widget, resized=False):
+        """ Draw `widget` with the next frame, or its bar if it `resized` """
+        self._dirty[widget] = self._dirty.get(widget, False) or resized
+        if self._frame is None:
+            self._frame = libqtile.qtile.call_later(self.settle, self._draw_frame)
+
+    def _draw_frame(self):
+        self._frame = None
+        dirty, self._dirty = self._dirty, {}
+
+        # a length change moves the neighbours: the bar lays its widgets
+        # out again and repaints them, as after a stock widget's
+        resized = {widget.bar for widget, moved in dirty.items() if moved}
+        for bar in resized:
+            bar.draw()
+        for widget in dirty:
+            if widget.bar not in resized:
+                widget.draw()
+
+
+# shared by the sampler and every widget in custom.widgets
+wheel = TimerWheel()
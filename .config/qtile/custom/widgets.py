@@ -1,15 +1,261 @@
 #!/usr/bin/env python3
 
-import psutil
+import asyncio
+import os
+import re
+import subprocess
+import time
+from array import array
+from string import Formatter
 
-from libqtile.widget import base
+from libqtile import pangocffi
+from libqtile.log_utils import logger
+from libqtile.widget import base, clock, prompt
 
+from custom import icons
+from custom.pulse import pulse
+from custom.run import RunCompleter, runner
+from custom.sampler import sampler
+from custom.ticker import wheel
 
-class CPU(base.ThreadPoolText):
+
+def suspend(bar):
+    """
+    Stop every widget in `bar` from polling, until `resume`: the polling
+    widgets of the bar are ours, and pause themselves.
+    """
+    for widget in bar.widgets:
+        if getattr(widget, 'suspended', False):
+            continue
+        widget.suspended = True
+        if hasattr(widget, 'pause'):
+            widget.pause()
+
+
+def resume(bar):
+    """ Let the widgets in `bar` poll again, refreshing them right away """
+    for widget in bar.widgets:
+        if not getattr(widget, 'suspended', False):
+            continue
+        widget.suspended = False
+        if hasattr(widget, 'unpause'):
+            widget.unpause()
+
+
+def show_bar(bar, show=None):
+    """
+    Show, hide or (by default) toggle `bar`, its widgets only polling
+    while it is shown. bar.show lays the windows out again around it.
+    """
+    # not set up yet, or finalized
+    if bar.window is None:
+        return
+    if show is None:
+        show = not bar.is_show()
+    if show == bar.is_show():
+        return
+
+    if not show:
+        suspend(bar)
+    bar.show(show)
+    if show:
+        resume(bar)
+
+
+class _Framed:
+    """
+    _TextBox.update drawing with the timer wheel's next frame, so the
+    widgets updated by one tick share a single repaint.
+    """
+
+    def update(self, text):
+        # not placed in the bar yet, or finalized
+        if not self.can_draw():
+            return
+        if self.text == text:
+            return
+        if text is None:
+            text = ""
+
+        old_length = self.length
+        self.text = text
+        wheel.invalidate(self, resized=self.length != old_length)
+
+
+class _Segment(_Framed, base._TextBox):
+    """
+    A powerline segment drawn in one pass: `head` glyphs, an `icon`, the
+    text and `tail` glyphs, so the arrows and icons around a text do not
+    need TextBox and Image widgets of their own.
+    """
+    orientations = base.ORIENTATION_HORIZONTAL
+    defaults = [
+        ("head", "", "Glyphs drawn before the icon, e.g. a powerline arrow"),
+        ("head_foreground", None, "Colour of the head glyphs, the foreground if None"),
+        ("head_background", None, "Background of the head glyphs, the widget's if None"),
+        ("tail", "", "Glyphs drawn after the text"),
+        ("tail_foreground", None, "Colour of the tail glyphs, the foreground if None"),
+        ("tail_background", None, "Background of the tail glyphs, the widget's if None"),
+        ("glyph_fontsize", 20, "Font size of the head and tail glyphs"),
+        ("icon", None, "PNG drawn before the text, scaled to the bar height (see custom.icons)"),
+        ("icon_margin", 0, "Margin around the icon"),
+        (
+            "keep_width",
+            False,
+            "Never shrink the text area: for a format of padded, fixed-width "
+            "readings, where a narrower text is a glitch not worth moving "
+            "the neighbours for",
+        ),
+    ]
+
+    def __init__(self, text=" ", **config):
+        super().__init__(text, **config)
+        self.add_defaults(_Segment.defaults)
+        self.icon_img = None
+        self.head_layout = None
+        self.tail_layout = None
+        self._text_length = 0
+
+    def _configure(self, qtile, bar):
+        super()._configure(qtile, bar)
+
+        if self.icon:
+            try:
+                self.icon_img = icons.load(self.icon, self.bar.height - 2 * self.icon_margin)
+            except OSError:
+                logger.warning("Image does not exist: %s", self.icon)
+
+        if self.head:
+            self.head_layout = self.drawer.textlayout(
+                self.head, self.head_foreground or self.foreground,
+                self.font, self.glyph_fontsize, None)
+        if self.tail:
+            self.tail_layout = self.drawer.textlayout(
+                self.tail, self.tail_foreground or self.foreground,
+                self.font, self.glyph_fontsize, None)
+
+    @property
+    def head_length(self):
+        return self.head_layout.width if self.head_layout else 0
+
+    @property
+    def icon_length(self):
+        return self.icon_img.width + 2 * self.icon_margin if self.icon_img else 0
+
+    @property
+    def tail_length(self):
+        return self.tail_layout.width if self.tail_layout else 0
+
+    def text_length(self):
+        if not self.keep_width:
+            return super().calculate_length()
+        # the widest text so far
+        self._text_length = max(self._text_length, super().calculate_length())
+        return self._text_length
+
+    def content_length(self):
+        """ Length of what is between the icon and the tail """
+        return self.text_length()
+
+    def calculate_length(self):
+        return (self.head_length + self.icon_length
+                + self.content_length() + self.tail_length)
+
+    def draw(self):
+        if not self.can_draw():
+            return
+
+        background = self.background or self.bar.background
+        self.drawer.clear(background)
+        x = 0
+
+        if self.head_layout:
+            self.draw_glyphs(self.head_layout, x, self.head_background)
+            x += self.head_length
+
+        if self.icon_img:
+            self.drawer.ctx.save()
+            self.drawer.ctx.translate(x + self.icon_margin, self.icon_margin)
+            self.drawer.ctx.set_source(self.icon_img.pattern)
+            self.drawer.ctx.paint()
+            self.drawer.ctx.restore()
+            x += self.icon_length
+
+        self.draw_content(x)
+        x += self.content_length()
+
+        if self.tail_layout:
+            self.draw_glyphs(self.tail_layout, x, self.tail_background)
+
+        self.drawer.draw(offsetx=self.offsetx, offsety=self.offsety, width=self.width)
+
+    def draw_glyphs(self, layout, x, background):
+        if background:
+            self.drawer.set_source_rgb(background)
+            self.drawer.ctx.rectangle(x, 0, layout.width, self.bar.height)
+            self.drawer.ctx.fill()
+        layout.draw(x, int(self.bar.height / 2.0 - layout.height / 2.0) + 1)
+
+    def draw_content(self, x):
+        if self.text:
+            self.layout.draw(
+                x + (self.actual_padding or 0),
+                int(self.bar.height / 2.0 - self.layout.height / 2.0) + 1,
+            )
+
+
+class Segment(_Segment):
+    """ A static powerline segment: glyphs, an icon and a fixed text """
+
+    def __init__(self, text="", **config):
+        super().__init__(text, **config)
+
+
+class _SampledText(_Segment):
+    """
+    Base for the text widgets fed by the shared sampler instead of running a
+    timer of their own. `sources` names what the sampler has to read for
+    `poll`, which turns a snapshot into the widget text.
+    """
+    sources = ()
+
+    def __init__(self, **config):
+        super().__init__("", **config)
+
+    def timer_setup(self):
+        sampler.subscribe(self)
+
+    def pause(self):
+        sampler.unsubscribe(self)
+
+    def unpause(self):
+        sampler.subscribe(self)
+
+    def finalize(self):
+        sampler.unsubscribe(self)
+        super().finalize()
+
+    def on_sample(self, snapshot):
+        """ Returns whether the text changed """
+        text = self.poll(snapshot)
+        changed = text != self.text
+        self.update(text)
+        return changed
+
+    def poll(self, snapshot):
+        """ The text for `snapshot` """
+        return ""
+
+
+class CPU(_SampledText):
     """
     A simple widget to display CPU load and frequency.
 
-    Widget requirements: psutil_.
+    With `graph` set, the load of each core is drawn after the text, either
+    as one bar per core or as a sparkline of its last `history` samples. The
+    history lives in a ring buffer allocated once, so ticks allocate nothing.
+
+    Widget requirements: psutil_, unless `backend` is 'proc'.
 
     .. _psutil: https://pypi.org/project/psutil/
     """
@@ -20,19 +266,534 @@ class CPU(base.ThreadPoolText):
             "CPU {freq_current}GHz {load_percent}%",
             "CPU display format",
         ),
+        ("backend", "psutil", "Where load and frequency come from: 'psutil' or 'proc'"),
+        ("graph", None, "Per-core load graph: 'bars', 'sparkline' or None"),
+        ("history", 16, "Samples kept per core for the sparkline"),
+        ("graph_core_width", 4, "Width in pixels of each core's bar or sparkline"),
+        ("graph_spacing", 1, "Pixels between two cores"),
+        ("graph_margin", 3, "Vertical margin of the graph"),
+        ("graph_color", None, "Graph colour, the foreground if None"),
     ]
 
     def __init__(self, **config):
-        super().__init__("", **config)
+        super().__init__(**config)
         self.add_defaults(CPU.defaults)
+        self.sources = ('proc_cpu',) if self.backend == 'proc' else ('cpu',)
+        self._last_values = None
+
+        self.cores = os.cpu_count() or 1
+        if self.graph == 'sparkline':
+            # core-major ring: core c owns [c * history, (c + 1) * history)
+            self._ring = array('d', bytes(8 * self.cores * self.history))
+        elif self.graph == 'bars':
+            self._ring = array('d', bytes(8 * self.cores))
+            self.history = 1
+        else:
+            self._ring = None
+        self._head = 0
+
+    @property
+    def graph_length(self):
+        if self._ring is None:
+            return 0
+        return (self.cores * (self.graph_core_width + self.graph_spacing)
+                + self.graph_spacing)
+
+    def content_length(self):
+        return super().content_length() + self.graph_length
+
+    def on_sample(self, snapshot):
+        if self._ring is None:
+            return super().on_sample(snapshot)
+
+        moved = self.push(snapshot['cpu_percpu'])
+        text = self.poll(snapshot)
+        # the graph moved even when the text did not
+        if text == self.text:
+            if moved:
+                wheel.invalidate(self)
+            return moved
+        self.update(text)
+        return True
+
+    def push(self, loads):
+        """
+        Overwrite the oldest sample of every core, returns whether any load
+        differs from the previous sample
+        """
+        history, head, ring = self.history, self._head, self._ring
+        last = (head - 1) % history
+        moved = False
+        for core in range(min(self.cores, len(loads))):
+            start = core * history
+            moved = moved or ring[start + last] != loads[core]
+            ring[start + head] = loads[core]
+        self._head = (head + 1) % history
+        return moved
+
+    def poll(self, snapshot):
+        load = round(snapshot['cpu_percent'], 1)
+        freq = snapshot['cpu_freq']
+        # the text only changes with what it shows, skip the formatting
+        if (load, freq) == self._last_values:
+            return self.text
+        self._last_values = (load, freq)
 
-    def poll(self):
         variables = dict()
 
-        variables["load_percent"] = round(psutil.cpu_percent(), 1)
-        freq = psutil.cpu_freq()
+        variables["load_percent"] = load
         variables["freq_current"] = round(freq.current, 1)
         variables["freq_max"] = round(freq.max / 1000, 1)
         variables["freq_min"] = round(freq.min / 1000, 1)
 
         return self.format.format(**variables)
+
+    def draw_content(self, x):
+        super().draw_content(x)
+        if self._ring is not None:
+            self.draw_graph(x + self.text_length() + self.graph_spacing)
+
+    def draw_graph(self, x):
+        ctx = self.drawer.ctx
+        history, ring = self.history, self._ring
+        top = self.graph_margin
+        height = self.bar.height - 2 * self.graph_margin
+        width = self.graph_core_width
+        # oldest sample first, right after the newest
+        head = self._head
+        step = width / max(history - 1, 1)
+
+        self.drawer.set_source_rgb(self.graph_color or self.foreground)
+        for core in range(self.cores):
+            start = core * history
+            if self.graph == 'bars':
+                load = ring[start] / 100
+                ctx.rectangle(x, top + height * (1 - load), width, height * load)
+                ctx.fill()
+            else:
+                ctx.move_to(x, top + height * (1 - ring[start + head] / 100))
+                for i in range(1, history):
+                    load = ring[start + (head + i) % history] / 100
+                    ctx.line_to(x + i * step, top + height * (1 - load))
+                ctx.set_line_width(1)
+                ctx.stroke()
+            x += width + self.graph_spacing
+
+
+class Memory(_SampledText):
+    """
+    widget.Memory reading /proc/meminfo through the sampler. Takes the same
+    format fields: MemUsed, MemTotal, MemFree, MemPercent, Buffers, Active,
+    Inactive, Shmem, SwapTotal, SwapFree, SwapUsed, SwapPercent, mm and ms.
+    Only the meminfo lines those fields need are parsed.
+    """
+    defaults = [
+        ("format", "{MemUsed: .0f}{mm}/{MemTotal: .0f}{mm}", "Formatting for field names."),
+        ("update_interval", 1.0, "Update interval for the Memory"),
+        ("measure_mem", "M", "Measurement for Memory (G, M, K, B)"),
+        ("measure_swap", "M", "Measurement for Swap (G, M, K, B)"),
+    ]
+    sources = ('meminfo',)
+
+    measures = {"G": 1024 * 1024 * 1024, "M": 1024 * 1024, "K": 1024, "B": 1}
+
+    # the /proc/meminfo lines behind each format field
+    meminfo_fields = {
+        "MemUsed": ("MemTotal", "MemFree", "Buffers", "Cached", "SReclaimable"),
+        "MemTotal": ("MemTotal",),
+        "MemFree": ("MemFree",),
+        "MemPercent": ("MemTotal", "MemAvailable"),
+        "Buffers": ("Buffers",),
+        "Active": ("Active",),
+        "Inactive": ("Inactive",),
+        "Shmem": ("Shmem",),
+        "SwapTotal": ("SwapTotal",),
+        "SwapFree": ("SwapFree",),
+        "SwapUsed": ("SwapTotal", "SwapFree"),
+        "SwapPercent": ("SwapTotal", "SwapFree"),
+    }
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self.add_defaults(Memory.defaults)
+        self.calc_mem = self.measures[self.measure_mem]
+        self.calc_swap = self.measures[self.measure_swap]
+
+        names = {name for _, name, _, _ in Formatter().parse(self.format) if name}
+        self.fields = {'meminfo': {field for name in names
+                                   for field in self.meminfo_fields.get(name, ())}}
+
+    def poll(self, snapshot):
+        # fields the format does not use were not read, they count as 0
+        mem = snapshot['meminfo']
+        total, free = mem.get('MemTotal', 0), mem.get('MemFree', 0)
+        # same arithmetic as psutil.virtual_memory()
+        cached = mem.get('Cached', 0) + mem.get('SReclaimable', 0)
+        used = total - free - mem.get('Buffers', 0) - cached
+        available = mem.get('MemAvailable', 0)
+        swap_total, swap_free = mem.get('SwapTotal', 0), mem.get('SwapFree', 0)
+
+        val = {}
+        val["MemUsed"] = used / self.calc_mem
+        val["MemTotal"] = total / self.calc_mem
+        val["MemFree"] = free / self.calc_mem
+        val["MemPercent"] = round((total - available) / total * 100, 1) if total else 0.0
+        val["Buffers"] = mem.get('Buffers', 0) / self.calc_mem
+        val["Active"] = mem.get('Active', 0) / self.calc_mem
+        val["Inactive"] = mem.get('Inactive', 0) / self.calc_mem
+        val["Shmem"] = mem.get('Shmem', 0) / self.calc_mem
+        val["SwapTotal"] = swap_total / self.calc_swap
+        val["SwapFree"] = swap_free / self.calc_swap
+        val["SwapUsed"] = (swap_total - swap_free) / self.calc_swap
+        val["SwapPercent"] = (round((swap_total - swap_free) / swap_total * 100, 1)
+                              if swap_total else 0.0)
+        val["mm"] = self.measure_mem
+        val["ms"] = self.measure_swap
+        return self.format.format(**val)
+
+
+class ThermalSensor(_SampledText):
+    """
+    widget.ThermalSensor reading the sysfs temperatures through the sampler.
+    Without `tag_sensor` the first sensor found is shown.
+    """
+    defaults = [
+        ("metric", True, "True to use metric/C, False to use imperial/F"),
+        ("show_tag", False, "Show tag sensor"),
+        ("update_interval", 2, "Update interval in seconds"),
+        ("tag_sensor", None, 'Tag of the temperature sensor. For example: "temp1" or "Core 0"'),
+        (
+            "threshold",
+            70,
+            "If the current temperature value is above, "
+            "then change to foreground_alert colour",
+        ),
+        ("foreground_alert", "ff0000", "Foreground colour alert"),
+    ]
+    sources = ('temps',)
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self.add_defaults(ThermalSensor.defaults)
+        self.foreground_normal = self.foreground
+
+        sensors = sampler.reader('temps').sensors
+        if self.tag_sensor is None and sensors:
+            self.tag_sensor = sensors[0][0]
+        # only the shown sensor is read
+        self.fields = {'temps': {self.tag_sensor}}
+
+    def poll(self, snapshot):
+        if self.tag_sensor is None:
+            return "Temperature sensors not found"
+        temps = snapshot['temps']
+
+        text = ""
+        if self.show_tag:
+            text = self.tag_sensor + ": "
+
+        temp = temps.get(self.tag_sensor)
+        if temp is None:
+            return text + "N/A"
+
+        # the threshold is in the displayed unit, as in widget.ThermalSensor
+        if not self.metric:
+            temp = temp * 1.8 + 32
+        if temp > self.threshold:
+            self.layout.colour = self.foreground_alert
+        else:
+            self.layout.colour = self.foreground_normal
+
+        return text + str(round(temp, 1)) + ("°C" if self.metric else "°F")
+
+
+class NvidiaSensors(_Segment):
+    """
+    widget.NvidiaSensors on one long-running `nvidia-smi --loop-ms` instead
+    of a new process per update: its csv lines are read from the event loop
+    as they come. `nvidia_smi` may be anything printing the same lines, e.g.
+    a fake nvidia-smi script.
+    """
+    defaults = [
+        (
+            "format",
+            "{temp}°C",
+            "Display string format. Three options available:  "
+            "``{temp}`` - temperature, ``{fan_speed}`` and ``{perf}`` - "
+            "performance level",
+        ),
+        ("foreground_alert", "ff0000", "Foreground colour alert"),
+        (
+            "gpu_bus_id",
+            "",
+            "GPU's Bus ID, ex: ``01:00.0``. If leave empty will display all available GPU's",
+        ),
+        ("update_interval", 2, "Update interval in seconds."),
+        (
+            "threshold",
+            70,
+            "If the current temperature value is above, "
+            "then change to foreground_alert colour",
+        ),
+        ("nvidia_smi", "nvidia-smi", "nvidia-smi executable"),
+        ("respawn_delay", 10, "Seconds before restarting a query process that exited"),
+    ]
+
+    sensors_mapping = {
+        "fan_speed": "fan.speed",
+        "perf": "pstate",
+        "temp": "temperature.gpu",
+    }
+
+    def __init__(self, **config):
+        super().__init__("", **config)
+        self.add_defaults(NvidiaSensors.defaults)
+        self.foreground_normal = self.foreground
+        self.sensors = list(dict.fromkeys(re.findall("{(.+?)}", self.format)))
+        self.process = None
+        self._buffer = b''
+        # {gpu index: {sensor: value}}
+        self._gpus = {}
+
+    def timer_setup(self):
+        self.spawn()
+
+    def spawn(self):
+        if not all(sensor in self.sensors_mapping for sensor in self.sensors):
+            self.update("Wrong sensor name")
+            return
+        # already running, or the bar got hidden before a respawn
+        if self.process is not None or getattr(self, 'suspended', False):
+            return
+
+        query = ['index'] + [self.sensors_mapping[sensor] for sensor in self.sensors]
+        command = [self.nvidia_smi,
+                   '--query-gpu=' + ','.join(query),
+                   '--format=csv,noheader',
+                   '--loop-ms={}'.format(int(self.update_interval * 1000))]
+        if self.gpu_bus_id:
+            command += ['-i', self.gpu_bus_id]
+
+        try:
+            self.process = subprocess.Popen(command,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.DEVNULL)
+        except OSError:
+            logger.warning("Unable to start %s", self.nvidia_smi)
+            return
+
+        fd = self.process.stdout.fileno()
+        os.set_blocking(fd, False)
+        self._buffer = b''
+        asyncio.get_running_loop().add_reader(fd, self._on_readable)
+
+    def _on_readable(self):
+        """ Take in what the query process printed so far """
+        try:
+            data = os.read(self.process.stdout.fileno(), 4096)
+        except BlockingIOError:
+            return
+
+        if not data:
+            self.stop()
+            logger.warning("%s exited, restarting it in %ss", self.nvidia_smi, self.respawn_delay)
+            self.timeout_add(self.respawn_delay, self.spawn)
+            return
+
+        *lines, self._buffer = (self._buffer + data).split(b'\n')
+        for line in lines:
+            self.parse(line)
+        if lines:
+            self.update(self.render())
+
+    def parse(self, line):
+        values = line.decode().replace(' ', '').split(',')
+        if len(values) != len(self.sensors) + 1:
+            return
+        self._gpus[values[0]] = dict(zip(self.sensors, values[1:]))
+
+    def render(self):
+        alert = False
+        for gpu in self._gpus.values():
+            try:
+                alert = alert or int(gpu.get('temp', 0)) > self.threshold
+            except ValueError:
+                pass
+        self.foreground = self.foreground_alert if alert else self.foreground_normal
+
+        return " - ".join(self.format.format(**self._gpus[index])
+                          for index in sorted(self._gpus))
+
+    def stop(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        asyncio.get_running_loop().remove_reader(process.stdout.fileno())
+        process.stdout.close()
+        if process.poll() is None:
+            process.terminate()
+            self._reap(process, time.monotonic())
+
+    @staticmethod
+    def _reap(process, start):
+        """ Wait for `process` from the event loop, killing it after a second """
+        if process.poll() is not None:
+            return
+        if time.monotonic() - start > 1:
+            process.kill()
+        # not a widget timer: finalize cancels those, this outlives the widget
+        asyncio.get_running_loop().call_later(0.1, NvidiaSensors._reap, process, start)
+
+    def pause(self):
+        self.stop()
+
+    def unpause(self):
+        self.spawn()
+
+    def finalize(self):
+        self.stop()
+        super().finalize()
+
+
+class PulseVolume(_Segment):
+    """
+    widget.PulseVolume without a poll: the text follows custom.pulse, the
+    connection the volume keys go through too, so a held key shows every
+    target in order as soon as it is set.
+    """
+    defaults = [
+        ("mute_text", "M", "Text shown while muted"),
+        ("step", 2, "Volume change in percent of a mouse wheel step"),
+        ("pulse", None, "The custom.pulse.Pulse to follow, the shared one if None"),
+    ]
+
+    def __init__(self, **config):
+        super().__init__("", **config)
+        self.add_defaults(PulseVolume.defaults)
+        if self.pulse is None:
+            self.pulse = pulse
+        self.add_callbacks({
+            'Button1': self.cmd_mute,
+            'Button4': self.cmd_increase_vol,
+            'Button5': self.cmd_decrease_vol,
+        })
+
+    def timer_setup(self):
+        self.pulse.subscribe(self.on_change)
+
+    def on_change(self, volume, muted):
+        if volume is None:
+            self.update("")
+        else:
+            self.update(self.mute_text if muted else "{}%".format(volume))
+
+    def cmd_mute(self):
+        self.pulse.toggle_mute()
+
+    def cmd_increase_vol(self):
+        self.pulse.change(self.step)
+
+    def cmd_decrease_vol(self):
+        self.pulse.change(-self.step)
+
+    def pause(self):
+        self.pulse.unsubscribe(self.on_change)
+
+    def unpause(self):
+        self.pulse.subscribe(self.on_change)
+
+    def finalize(self):
+        self.pause()
+        super().finalize()
+
+
+class RunPrompt(prompt.Prompt):
+    """
+    widget.Prompt with the 'run' completion of custom.run, showing the
+    `candidates` first matches of the program name, as Tab goes through
+    them, after the input. On a hidden bar (the focus layouts) the bar
+    shows up while it reads, the windows making room for it.
+    """
+    defaults = [
+        ("candidates", 5, "Ranked matches shown after the input, none with 0"),
+        ("candidates_foreground", "888888", "Colour of the matches"),
+    ]
+    completers = dict(prompt.Prompt.completers, run=RunCompleter)
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self.add_defaults(RunPrompt.defaults)
+        # whether the bar was hidden before the prompt showed it
+        self.shown = False
+        self.input_fmt = self.fmt
+
+    def start_input(self, *args, **kwargs):
+        if not self.active:
+            # what was installed or launched since the last prompt
+            runner.start()
+            if not self.bar.is_show():
+                self.shown = True
+                show_bar(self.bar, True)
+        super().start_input(*args, **kwargs)
+
+    def _update(self):
+        # the matches go in fmt: Prompt._update builds the text from itself
+        self.fmt = self.input_fmt
+        if self.active and self.candidates:
+            matches = self.ranked(self.archived_input or self.user_input)
+            if matches:
+                self.fmt += '  <span foreground="#{}">{}</span>'.format(
+                    self.candidates_foreground,
+                    pangocffi.markup_escape_text(' '.join(matches)).replace('{', '{{').replace('}', '}}'))
+        super()._update()
+
+    def ranked(self, text):
+        """ The first matches of a program name, nothing for a text with arguments """
+        if not text or ' ' in text or '/' in text:
+            return []
+        return runner.matches(text)[:self.candidates]
+
+    def _unfocus(self):
+        super()._unfocus()
+        if self.shown:
+            self.shown = False
+            show_bar(self.bar, False)
+
+
+class Clock(_Framed, clock.Clock):
+    """
+    widget.Clock ticking from the timer wheel: on the minute, or on the
+    second when the format shows seconds, together with the other widgets.
+    """
+    defaults = [
+        (
+            "update_interval",
+            None,
+            "Seconds between updates, None for every second if the format "
+            "shows seconds and every minute otherwise",
+        ),
+    ]
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self.add_defaults(Clock.defaults)
+        if self.update_interval is None:
+            seconds = any(c in self.format for c in ('%S', '%s', '%T', '%X', '%c', '%r'))
+            self.update_interval = 1 if seconds else 60
+
+    def timer_setup(self):
+        self.unpause()
+
+    def tick(self):
+        self.update(self.poll())
+
+    def pause(self):
+        wheel.cancel(self.update_interval, self.tick)
+
+    def unpause(self):
+        self.tick()
+        wheel.every(self.update_interval, self.tick)
+
+    def finalize(self):
+        self.pause()
+        super().finalize()